@@ -0,0 +1,306 @@
+"""图片压缩流程的可复现基准测试
+
+在本地生成合成图片集（不同尺寸、格式和宽高比），分别统计解码、缩放（含裁剪）、编码各阶段耗时，
+以及不同预设组合和并行进程数下的整体吞吐量，结果写入 JSON 以便在不同版本之间比较：
+
+    python benchmarks/bench_pipeline.py --quick -o before.json
+    python benchmarks/bench_pipeline.py --quick -o after.json --compare before.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL
+from PIL import Image
+
+from image_pipeline import compress, encode_image, fit_geometry, render_presets, shrink_on_load
+
+# 结果文件格式版本，格式不兼容时递增
+RESULTS_VERSION = 2
+
+# 合成图片的长边尺寸
+SIZES = {
+    'small': 640,
+    'medium': 2000,
+    'large': 6000,
+}
+# 宽高比（宽 / 高）
+ASPECTS = {
+    'landscape': 4 / 3,
+    'portrait': 2 / 3,
+    'square': 1.0,
+    'panorama': 3.0,
+}
+FORMATS = ('jpg', 'png', 'tiff')
+
+# 预设组合
+PRESET_MIXES = {
+    'single': [
+        {'width': 800, 'height': 600, 'quality': 80, 'crop': False},
+    ],
+    'thumbnails': [
+        {'width': 400, 'height': 400, 'quality': 75, 'crop': True},
+        {'width': 200, 'height': 200, 'quality': 75, 'crop': True},
+    ],
+    'responsive': [
+        {'width': width, 'height': width * 3 // 4, 'quality': 80, 'crop': False}
+        for width in (1920, 1600, 1280, 1024, 800, 640, 480, 320)
+    ],
+}
+
+QUICK = {
+    'sizes': ['small', 'medium'],
+    'aspects': ['landscape', 'portrait'],
+    'formats': ['jpg', 'png'],
+    'count': 2,
+    'workers': [1, 2],
+    'repeat': 1,
+}
+
+
+def synthetic_image(width, height, seed):
+    """生成确定性的合成图片（分形纹理加渐变，压缩特性接近照片）"""
+    offset = (seed % 7) * 0.05
+    texture = Image.effect_mandelbrot((width, height), (-2.0 + offset, -1.2, 0.8 + offset, 1.2), 64)
+    horizontal = Image.linear_gradient('L').rotate(90).resize((width, height))
+    radial = Image.radial_gradient('L').resize((width, height))
+    return Image.merge('RGB', (texture, horizontal, radial))
+
+
+def generate_corpus(corpus_dir, sizes, aspects, formats, count):
+    """生成合成图片集，返回 {分组名称: [文件路径]}；已存在的文件直接复用"""
+    corpus = {}
+    for size_name in sizes:
+        long_edge = SIZES[size_name]
+        for aspect_name in aspects:
+            aspect = ASPECTS[aspect_name]
+            if aspect >= 1:
+                width, height = long_edge, max(1, round(long_edge / aspect))
+            else:
+                width, height = max(1, round(long_edge * aspect)), long_edge
+            for image_format in formats:
+                group = f"{size_name}-{aspect_name}-{image_format}"
+                group_dir = os.path.join(corpus_dir, group)
+                os.makedirs(group_dir, exist_ok=True)
+                paths = []
+                for index in range(count):
+                    path = os.path.join(group_dir, f"{group}-{index}.{image_format}")
+                    if not os.path.exists(path):
+                        img = synthetic_image(width, height, index)
+                        if image_format == 'jpg':
+                            img.save(path, 'JPEG', quality=90)
+                        else:
+                            img.save(path)
+                    paths.append(path)
+                corpus[group] = paths
+    return corpus
+
+
+def time_stages(paths, presets):
+    """逐个统计每张图片在各阶段的耗时（毫秒），返回 {阶段: [耗时]}"""
+    stages = {'decode': [], 'resize': [], 'encode': [], 'render': []}
+    for path in paths:
+        start = time.perf_counter()
+        with Image.open(path) as img:
+            original_size = img.size
+            source_img = shrink_on_load(img, presets)
+        stages['decode'].append((time.perf_counter() - start) * 1000)
+
+        resize_ms = encode_ms = 0.0
+        x_scale = source_img.width / original_size[0]
+        y_scale = source_img.height / original_size[1]
+        for preset in presets:
+            # 逐个预设直接从解码结果缩放（需要裁剪时只对裁剪区域重采样）
+            new_size, _, box = fit_geometry(original_size, preset)
+            if box is not None:
+                box = (box[0] * x_scale, box[1] * y_scale, box[2] * x_scale, box[3] * y_scale)
+            start = time.perf_counter()
+            resized_img = source_img.resize(new_size, Image.Resampling.LANCZOS, box=box)
+            resize_ms += (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            encode_image(resized_img, path, preset['quality'])
+            encode_ms += (time.perf_counter() - start) * 1000
+        stages['resize'].append(resize_ms)
+        stages['encode'].append(encode_ms)
+
+        # 实际处理流程（缩放级联）的耗时，用于与逐个预设缩放对比
+        start = time.perf_counter()
+        for _ in render_presets(source_img, presets, original_size):
+            pass
+        stages['render'].append((time.perf_counter() - start) * 1000)
+    return stages
+
+
+def summarize(values):
+    """汇总一组耗时"""
+    return {
+        'median_ms': round(statistics.median(values), 3),
+        'min_ms': round(min(values), 3),
+        'mean_ms': round(statistics.fmean(values), 3),
+    }
+
+
+def run_stage_benchmarks(corpus, mixes, repeat):
+    results = []
+    for group, paths in corpus.items():
+        for mix_name in mixes:
+            presets = PRESET_MIXES[mix_name]
+            merged = {}
+            for _ in range(repeat):
+                for stage, values in time_stages(paths, presets).items():
+                    merged.setdefault(stage, []).extend(values)
+            results.append({
+                'corpus': group,
+                'mix': mix_name,
+                'images': len(paths),
+                'stages': {stage: summarize(values) for stage, values in merged.items()},
+            })
+            print(f"  {group:<28} {mix_name:<11} "
+                  + " ".join(f"{stage}={summarize(values)['median_ms']:.1f}ms"
+                             for stage, values in merged.items()))
+    return results
+
+
+def run_throughput_benchmarks(corpus, mixes, worker_counts, repeat, work_dir):
+    paths = [path for group_paths in corpus.values() for path in group_paths]
+    input_bytes = sum(os.path.getsize(path) for path in paths)
+    results = []
+    for mix_name in mixes:
+        presets = PRESET_MIXES[mix_name]
+        for workers in worker_counts:
+            timings = []
+            for _ in range(repeat):
+                output_folder = os.path.join(work_dir, f"out-{mix_name}-{workers}")
+                shutil.rmtree(output_folder, ignore_errors=True)
+                start = time.perf_counter()
+                errors = [result.error for result in compress(paths, presets, output_folder, workers=workers)
+                          if result.error is not None]
+                timings.append(time.perf_counter() - start)
+                if errors:
+                    raise RuntimeError(f"处理失败: {errors[0]}")
+            seconds = statistics.median(timings)
+            results.append({
+                'mix': mix_name,
+                'workers': workers,
+                'images': len(paths),
+                'outputs': len(paths) * len(presets),
+                'seconds': round(seconds, 4),
+                'images_per_sec': round(len(paths) / seconds, 3),
+                'outputs_per_sec': round(len(paths) * len(presets) / seconds, 3),
+                'input_mb_per_sec': round(input_bytes / seconds / 1e6, 3),
+            })
+            print(f"  {mix_name:<11} workers={workers:<3} {seconds:8.3f}s "
+                  f"{len(paths) / seconds:8.2f} 张/秒")
+    return results
+
+
+def git_revision():
+    """当前代码的 git 版本，不在 git 仓库中时返回 None"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """打印与基准结果的对比（比值小于 1 表示变快）"""
+    print("\n与基准结果对比（当前 / 基准，小于 1 表示更快）:")
+    base_stages = {(r['corpus'], r['mix']): r['stages'] for r in baseline.get('stages', [])}
+    for record in current.get('stages', []):
+        base = base_stages.get((record['corpus'], record['mix']))
+        if not base:
+            continue
+        ratios = " ".join(f"{stage}={record['stages'][stage]['median_ms'] / base[stage]['median_ms']:.2f}"
+                          for stage in record['stages']
+                          if stage in base and base[stage]['median_ms'] > 0)
+        print(f"  {record['corpus']:<28} {record['mix']:<11} {ratios}")
+    base_throughput = {(r['mix'], r['workers']): r for r in baseline.get('throughput', [])}
+    for record in current.get('throughput', []):
+        base = base_throughput.get((record['mix'], record['workers']))
+        if base:
+            print(f"  {record['mix']:<11} workers={record['workers']:<3} "
+                  f"吞吐量 {record['images_per_sec'] / base['images_per_sec']:.2f}x")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="图片压缩流程基准测试")
+    parser.add_argument("-o", "--output", help="结果 JSON 文件路径")
+    parser.add_argument("--compare", metavar="JSON", help="与之前的结果文件对比")
+    parser.add_argument("--quick", action="store_true", help="使用较小的图片集快速运行")
+    parser.add_argument("--corpus-dir", help="合成图片集目录（默认使用临时目录，指定后可复用）")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--aspects", nargs="+", choices=list(ASPECTS), default=list(ASPECTS))
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=list(FORMATS))
+    parser.add_argument("--mixes", nargs="+", choices=list(PRESET_MIXES), default=list(PRESET_MIXES))
+    parser.add_argument("--count", type=int, default=3, help="每组生成的图片数量")
+    parser.add_argument("--workers", nargs="+", type=int,
+                        default=sorted({1, 2, os.cpu_count() or 1}), help="测试的并行进程数")
+    parser.add_argument("--repeat", type=int, default=3, help="重复次数（取中位数）")
+    parser.add_argument("--skip-stages", action="store_true", help="不统计各阶段耗时")
+    parser.add_argument("--skip-throughput", action="store_true", help="不测试整体吞吐量")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.quick:
+        for key, value in QUICK.items():
+            setattr(args, key, value)
+
+    work_dir = tempfile.mkdtemp(prefix="image_compressor_bench_")
+    corpus_dir = args.corpus_dir or os.path.join(work_dir, "corpus")
+    try:
+        print("生成合成图片集...")
+        corpus = generate_corpus(corpus_dir, args.sizes, args.aspects, args.formats, args.count)
+
+        results = {
+            'version': RESULTS_VERSION,
+            'meta': {
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'pillow': PIL.__version__,
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'config': {
+                    'sizes': args.sizes, 'aspects': args.aspects, 'formats': args.formats,
+                    'mixes': args.mixes, 'count': args.count, 'workers': args.workers,
+                    'repeat': args.repeat,
+                },
+            },
+        }
+        if not args.skip_stages:
+            print("各阶段耗时（每张图片，中位数）:")
+            results['stages'] = run_stage_benchmarks(corpus, args.mixes, args.repeat)
+        if not args.skip_throughput:
+            print("整体吞吐量:")
+            results['throughput'] = run_throughput_benchmarks(corpus, args.mixes, args.workers,
+                                                              args.repeat, work_dir)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), results)
+    return 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
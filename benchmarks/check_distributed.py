@@ -0,0 +1,229 @@
+"""在本机用多个进程检查分布式处理（--distributed）
+
+在临时文件夹中生成合成图片，用 compress_cli.py 启动多个节点进程共同处理，检查：
+
+1. 并发节点：所有输出都已生成，每个 (图片, 预设) 只被一个节点处理过，处理结束后没有遗留的租约；
+2. 节点被杀死：一个节点持有租约时被强制结束，另一个节点在租约到期后接管它的块并完成处理。
+
+    python benchmarks/check_distributed.py
+    python benchmarks/check_distributed.py --nodes 4 --count 200 --keep
+
+全部检查通过时返回 0，否则打印失败原因并返回 1。
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import subprocess
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image
+
+from distributed import chunk_of, lease_dir_for, relative_key
+from image_pipeline import output_name_for, prepare_output_folders
+
+CLI = os.path.join(ROOT, "compress_cli.py")
+
+PRESETS = {
+    'large': {'width': 800, 'height': 600, 'quality': 80, 'crop': False},
+    'thumb': {'width': 200, 'height': 200, 'quality': 75, 'crop': True},
+}
+
+
+def synthetic_image(width, height, index):
+    """生成带渐变和色块的合成图片，每张内容不同"""
+    img = Image.radial_gradient('L').resize((width, height)).convert('RGB')
+    block = Image.new('RGB', (width // 3, height // 3), ((index * 37) % 256, (index * 91) % 256, 160))
+    img.paste(block, ((index * 53) % (width - block.width), (index * 29) % (height - block.height)))
+    return img
+
+
+def generate_images(folder, count, size):
+    """在 folder 及其子文件夹中生成 count 张图片，返回文件路径列表"""
+    paths = []
+    for index in range(count):
+        sub_folder = os.path.join(folder, f"album_{index % 4}")
+        os.makedirs(sub_folder, exist_ok=True)
+        path = os.path.join(sub_folder, f"img_{index:04d}.{'jpg' if index % 2 else 'png'}")
+        img = synthetic_image(size, size * 3 // 4, index)
+        if path.endswith('.jpg'):
+            img.save(path, 'JPEG', quality=90)
+        else:
+            img.save(path)
+        paths.append(path)
+    return paths
+
+
+def node_command(source, output, presets_file, node_id, args, report=None):
+    command = [sys.executable, CLI, source, "-o", output, "--presets-file", presets_file, "-r",
+               "--distributed", "--node-id", node_id, "--chunks", str(args.chunks),
+               "--lease-ttl", str(args.lease_ttl), "-j", str(args.workers), "-q"]
+    if report:
+        command += ["--report", report]
+    return command
+
+
+def expected_outputs(source, output, paths):
+    """所有 (图片, 预设) 的输出文件路径"""
+    presets = list(PRESETS.values())
+    preset_folders = prepare_output_folders(output, presets)
+    return {os.path.join(preset_folder, output_name_for(path, source, preset))
+            for path in paths for preset_folder, preset in zip(preset_folders, presets)}
+
+
+def leftover_leases(output, chunks):
+    lease_dir = lease_dir_for(output, list(PRESETS.values()), chunks)
+    if not os.path.isdir(lease_dir):
+        return []
+    return [name for name in os.listdir(lease_dir) if name.endswith('.lease')]
+
+
+def check_concurrent_nodes(work_dir, source, paths, presets_file, args):
+    """同时启动多个节点，检查输出完整且没有重复处理"""
+    output = os.path.join(work_dir, "out_concurrent")
+    reports = [os.path.join(work_dir, f"node_{index}.json") for index in range(args.nodes)]
+    start = time.perf_counter()
+    processes = [subprocess.Popen(node_command(source, output, presets_file, f"node-{index}", args, report))
+                 for index, report in enumerate(reports)]
+    codes = [process.wait() for process in processes]
+    elapsed = time.perf_counter() - start
+
+    errors = []
+    if any(codes):
+        errors.append(f"节点退出码: {codes}")
+    processed = {}
+    for index, report in enumerate(reports):
+        if not os.path.exists(report):
+            errors.append(f"node-{index} 没有生成报告")
+            continue
+        with open(report, 'r', encoding='utf-8') as f:
+            for row in json.load(f)['results']:
+                if row['status'] == 'ok':
+                    processed.setdefault(row['output'], []).append(f"node-{index}")
+    duplicates = {output_file: nodes for output_file, nodes in processed.items() if len(nodes) > 1}
+    if duplicates:
+        errors.append(f"{len(duplicates)} 个输出被多个节点处理，如 {next(iter(duplicates.items()))}")
+    expected = expected_outputs(source, output, paths)
+    missing = [output_file for output_file in expected if not os.path.exists(output_file)]
+    if missing:
+        errors.append(f"缺少 {len(missing)} 个输出，如 {missing[0]}")
+    if len(processed) != len(expected):
+        errors.append(f"各节点共处理 {len(processed)} 个输出，应为 {len(expected)} 个")
+    leases = leftover_leases(output, args.chunks)
+    if leases:
+        errors.append(f"遗留租约: {leases}")
+    per_node = [sum(f"node-{index}" in nodes for nodes in processed.values()) for index in range(args.nodes)]
+    print(f"并发节点: {args.nodes} 个节点 {elapsed:.1f} 秒处理 {len(processed)} 个输出，各节点分别处理 {per_node}")
+    return errors
+
+
+def kill_node(process):
+    """强制结束节点及其工作进程（模拟机器宕机）；只结束主进程时，进程池的工作进程会遗留下来"""
+    if hasattr(os, 'killpg'):
+        os.killpg(process.pid, signal.SIGKILL)
+    else:
+        process.kill()
+    process.wait()
+
+
+def wait_for_lease(output, chunks, process, timeout):
+    """等待节点创建第一个租约文件"""
+    deadline = time.time() + timeout
+    while time.time() < deadline and process.poll() is None:
+        if leftover_leases(output, chunks):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def check_killed_node(work_dir, source, paths, presets_file, args):
+    """节点持有租约时被杀死，检查另一个节点在租约到期后接管并完成处理"""
+    output = os.path.join(work_dir, "out_killed")
+    # 在单独的进程组中启动，以便连同工作进程一起结束
+    victim = subprocess.Popen(node_command(source, output, presets_file, "victim", args),
+                              start_new_session=hasattr(os, 'killpg'))
+    if not wait_for_lease(output, args.chunks, victim, timeout=60):
+        kill_node(victim)
+        return ["被杀死的节点没有认领到块（图片太少或处理太快，请增大 --count 或 --size）"]
+    time.sleep(0.2)
+    kill_node(victim)
+    # 被杀死的节点遗留的租约（不会再续期）
+    orphaned = sorted(int(name[len("chunk_"):-len(".lease")]) for name in leftover_leases(output, args.chunks))
+    if not orphaned:
+        return ["节点被杀死前已释放所有租约，请增大 --count 或 --size"]
+
+    report = os.path.join(work_dir, "rescuer.json")
+    start = time.perf_counter()
+    code = subprocess.call(node_command(source, output, presets_file, "rescuer", args, report))
+    elapsed = time.perf_counter() - start
+
+    errors = []
+    if code:
+        errors.append(f"接管节点退出码: {code}")
+    with open(report, 'r', encoding='utf-8') as f:
+        rescued = {row['source'] for row in json.load(f)['results'] if row['status'] == 'ok'}
+    orphaned_files = [path for path in paths if chunk_of(relative_key(path, source), args.chunks) in orphaned]
+    not_rescued = [path for path in orphaned_files if path not in rescued]
+    if not_rescued:
+        errors.append(f"被杀死节点的块中有 {len(not_rescued)} 张图片没有被接管处理，如 {not_rescued[0]}")
+    missing = [output_file for output_file in expected_outputs(source, output, paths)
+               if not os.path.exists(output_file)]
+    if missing:
+        errors.append(f"缺少 {len(missing)} 个输出，如 {missing[0]}")
+    leases = leftover_leases(output, args.chunks)
+    if leases:
+        errors.append(f"遗留租约: {leases}")
+    print(f"节点被杀死: 遗留租约的块 {orphaned}，接管节点 {elapsed:.1f} 秒完成"
+          f"（租约有效期 {args.lease_ttl} 秒）")
+    return errors
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="在本机用多个进程检查分布式处理")
+    parser.add_argument("--nodes", type=int, default=3, help="并发节点数")
+    parser.add_argument("--count", type=int, default=60, help="生成的图片数量")
+    parser.add_argument("--size", type=int, default=1200, help="图片宽度（像素）")
+    parser.add_argument("--chunks", type=int, default=16, help="块数")
+    parser.add_argument("--lease-ttl", type=float, default=3.0, help="租约有效期（秒）")
+    parser.add_argument("--workers", type=int, default=1, help="每个节点的并行进程数")
+    parser.add_argument("--keep", action="store_true", help="保留临时文件夹以便检查")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="image_compressor_distributed_")
+    try:
+        source = os.path.join(work_dir, "source")
+        print("生成合成图片...")
+        paths = generate_images(source, args.count, args.size)
+        presets_file = os.path.join(work_dir, "presets.json")
+        with open(presets_file, 'w', encoding='utf-8') as f:
+            json.dump(PRESETS, f, ensure_ascii=False, indent=2)
+
+        failures = []
+        for name, check in (("并发节点", check_concurrent_nodes), ("节点被杀死", check_killed_node)):
+            errors = check(work_dir, source, paths, presets_file, args)
+            failures.extend(f"{name}: {error}" for error in errors)
+    finally:
+        if args.keep:
+            print(f"临时文件夹: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    for failure in failures:
+        print(f"失败 - {failure}")
+    print("全部检查通过" if not failures else f"{len(failures)} 项检查失败")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,236 @@
+"""图片批量压缩命令行工具（不依赖 PyQt5，可在无显示环境下运行）
+
+使用图形界面保存的尺寸预设（~/.image_compressor_presets.json）处理图片：
+
+    python compress_cli.py 图片文件夹 -o 输出文件夹 -p 预设名称 -j 8
+
+用 --jobs 任务文件一次处理多组源文件夹和输出文件夹（格式见 image_pipeline.load_job_spec），
+所有文件夹的图片共用同一个进程池：
+
+    python compress_cli.py --jobs nightly.json -j 16
+
+加上 --distributed 时可以在多台机器（或多个进程）上对同一个共享文件夹运行相同的命令，
+各节点通过输出文件夹中的租约文件分块认领图片，共同完成处理（见 distributed.py）。
+
+加上 --watch 持续监视文件夹，新图片写入完成后几秒内自动处理，按 Ctrl+C 停止。
+"""
+import os
+import sys
+import argparse
+import threading
+import multiprocessing
+
+from distributed import DEFAULT_CHUNKS, DEFAULT_LEASE_TTL, compress_distributed
+from image_pipeline import (DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, DEFAULT_PRESETS_FILE, IMAGE_EXTENSIONS,
+                            READ_AHEAD_BYTES, WATCH_INTERVAL, WATCH_SETTLE, OutputCache, RunReport, compress,
+                            compress_jobs, default_memory_budget, describe_preset, load_job_spec, load_presets,
+                            scan_images, watch)
+
+
+def iter_sources(paths, recursive=False, include=None, exclude=None, skip_dirs=()):
+    """逐个产出命令行给出的图片文件，文件夹会边扫描边展开为其中的图片"""
+    for path in paths:
+        if os.path.isdir(path):
+            yield from scan_images(path, recursive, include, exclude, skip_dirs)
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            yield path
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="使用保存的尺寸预设批量压缩图片")
+    parser.add_argument("paths", nargs="*", help="图片文件或包含图片的文件夹")
+    parser.add_argument("-o", "--output", help="输出文件夹（只给出一个文件夹时默认为该文件夹）")
+    parser.add_argument("-p", "--preset", action="append", dest="presets", metavar="名称",
+                        help="要使用的预设名称，可重复指定；默认使用全部预设")
+    parser.add_argument("--presets-file", default=DEFAULT_PRESETS_FILE, help="预设文件路径")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count() or 1,
+                        help="并行进程数（默认为 CPU 核心数）")
+    parser.add_argument("--memory-budget", type=int, default=0, metavar="MB",
+                        help="同时处理的图片估算内存上限，超过时等待，超大图片单独处理（默认 0 为物理内存的一半）")
+    parser.add_argument("--read-ahead", type=int, default=READ_AHEAD_BYTES // (1024 * 1024), metavar="MB",
+                        help="提前读入内存的后续源文件总大小上限，读取与压缩同时进行，适合网络存储（默认 %(default)s MB，0 为不预读）")
+    parser.add_argument("-r", "--recursive", action="store_true",
+                        help="扫描子文件夹，输出中保留子文件夹结构")
+    parser.add_argument("--include", action="append", metavar="通配符",
+                        help="只处理匹配的文件，可重复指定（如 *.jpg 或 2024/*）")
+    parser.add_argument("--exclude", action="append", metavar="通配符",
+                        help="跳过匹配的文件，可重复指定")
+    parser.add_argument("--force", action="store_true",
+                        help="重新处理所有图片（默认跳过源文件和预设都未变化的输出）")
+    parser.add_argument("--hash", action="store_true", dest="use_hash",
+                        help="修改时间变化时比较文件内容哈希，内容相同则跳过")
+    parser.add_argument("--dedup", action="store_true",
+                        help="内容相同的图片只处理一张，其余副本硬链接或复制它的输出")
+    parser.add_argument("--cache", action="store_true",
+                        help="使用输出缓存：相同内容的源图片和预设直接复用之前编码的输出，不再解码")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="输出缓存文件夹")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE // (1024 * 1024), metavar="MB",
+                        help="输出缓存容量上限，超过时淘汰最久未使用的缓存（默认 %(default)s MB）")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视文件夹（只能给出一个文件夹），自动处理新增或修改的图片，按 Ctrl+C 停止")
+    parser.add_argument("--watch-interval", type=float, default=WATCH_INTERVAL, metavar="秒",
+                        help="监视时扫描文件夹的间隔（默认 %(default)s 秒）")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE, metavar="秒",
+                        help="文件大小和修改时间保持不变多久才视为写入完成（默认 %(default)s 秒）")
+    parser.add_argument("--new-only", action="store_true",
+                        help="监视时只处理启动之后新增或修改的图片")
+    parser.add_argument("--jobs", metavar="任务文件",
+                        help="按任务文件（JSON）处理多组源文件夹和输出文件夹，每组使用各自的预设，共用同一个进程池")
+    parser.add_argument("--distributed", action="store_true",
+                        help="与其他节点（其他进程或机器上运行的相同命令）通过共享文件系统分块共同处理一个文件夹")
+    parser.add_argument("--node-id", help="分布式处理时的节点名（默认为主机名和进程号）")
+    parser.add_argument("--chunks", type=int, default=DEFAULT_CHUNKS,
+                        help="分布式处理时把图片分成多少块，所有节点必须相同（默认 %(default)s）")
+    parser.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL, metavar="秒",
+                        help="分布式处理时块租约的有效期，节点失联超过这么久后它的块由其他节点接管（默认 %(default)s 秒）")
+    parser.add_argument("--report", metavar="路径",
+                        help="导出处理报告（各阶段耗时、压缩率、延迟百分位数），扩展名为 .csv 时导出 CSV，否则导出 JSON；"
+                             "使用任务文件时每个任务导出一份，文件名后加任务序号")
+    parser.add_argument("--list-presets", action="store_true", help="列出所有预设后退出")
+    parser.add_argument("-q", "--quiet", action="store_true", help="只输出失败信息和汇总")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        size_presets = load_presets(args.presets_file)
+    except Exception as e:
+        parser.error(f"加载预设失败: {e}")
+
+    if args.list_presets:
+        for name, preset in size_presets.items():
+            print(f"{name}: {describe_preset(preset)}")
+        return 0
+
+    memory_budget = args.memory_budget * 1024 * 1024 if args.memory_budget else default_memory_budget()
+    cache = OutputCache(args.cache_dir, args.cache_size * 1024 * 1024) if args.cache else None
+    read_ahead = args.read_ahead * 1024 * 1024
+
+    if args.jobs:
+        if args.paths or args.presets or args.output or args.watch:
+            parser.error("使用 --jobs 时请在任务文件中指定文件夹和预设")
+        try:
+            jobs = load_job_spec(args.jobs, size_presets)
+        except (OSError, ValueError) as e:
+            parser.error(f"加载任务文件失败: {e}")
+        return run_jobs(jobs, args, memory_budget, cache, read_ahead)
+
+    if not args.paths:
+        parser.error("请指定图片文件或文件夹")
+
+    names = args.presets or list(size_presets)
+    missing = [name for name in names if name not in size_presets]
+    if missing:
+        parser.error(f"找不到预设: {', '.join(missing)}")
+    if not names:
+        parser.error(f"没有可用的预设，请先在图形界面中创建预设 ({args.presets_file})")
+    presets = [size_presets[name] for name in names]
+
+    output_folder = args.output
+    if output_folder is None:
+        if len(args.paths) != 1 or not os.path.isdir(args.paths[0]):
+            parser.error("处理多个路径时请使用 -o 指定输出文件夹")
+        output_folder = args.paths[0]
+
+    if args.watch and (len(args.paths) != 1 or not os.path.isdir(args.paths[0])):
+        parser.error("--watch 只能监视一个文件夹")
+    if args.distributed:
+        if len(args.paths) != 1 or not os.path.isdir(args.paths[0]):
+            parser.error("--distributed 只能处理一个文件夹")
+        if args.watch or args.dedup:
+            parser.error("--distributed 不能与 --watch 或 --dedup 同时使用")
+        if args.chunks < 1 or args.lease_ttl <= 0:
+            parser.error("--chunks 和 --lease-ttl 必须大于 0")
+
+    # 递归扫描多个文件夹时，以它们的公共上级文件夹为根保留子文件夹结构
+    source_root = None
+    if args.recursive and all(os.path.isdir(path) for path in args.paths):
+        source_root = os.path.commonpath([os.path.abspath(path) for path in args.paths])
+    sources = iter_sources(args.paths, args.recursive, args.include, args.exclude,
+                           skip_dirs=[output_folder])
+
+    report = RunReport(presets)
+    if args.watch:
+        cancel_event = threading.Event()
+        results = watch(args.paths[0], presets, output_folder, cancel_event, interval=args.watch_interval,
+                        settle=args.settle, recursive=args.recursive, include=args.include,
+                        exclude=args.exclude, include_existing=not args.new_only, workers=args.workers,
+                        incremental=not args.force, use_hash=args.use_hash, memory_budget=memory_budget,
+                        dedup=args.dedup, cache=cache, read_ahead=read_ahead)
+        if not args.quiet:
+            print(f"正在监视 {args.paths[0]}，按 Ctrl+C 停止...")
+    elif args.distributed:
+        results = compress_distributed(args.paths[0], presets, output_folder, node_id=args.node_id,
+                                       chunks=args.chunks, lease_ttl=args.lease_ttl, workers=args.workers,
+                                       recursive=args.recursive, include=args.include, exclude=args.exclude,
+                                       incremental=not args.force, use_hash=args.use_hash,
+                                       memory_budget=memory_budget, cache=cache, read_ahead=read_ahead)
+    else:
+        results = compress(sources, presets, output_folder, workers=args.workers,
+                           incremental=not args.force, use_hash=args.use_hash,
+                           source_root=source_root, memory_budget=memory_budget, dedup=args.dedup,
+                           cache=cache, read_ahead=read_ahead)
+    try:
+        for result in results:
+            report.add(result)
+            print_result(result, args.quiet)
+    except KeyboardInterrupt:
+        if not args.watch:
+            raise
+        # 停止监视：关闭生成器，保存处理记录
+        results.close()
+
+    report.finish()
+    if args.report:
+        report.write(args.report)
+    print(f"处理完成！{summarize(report)}")
+    return 1 if report.error_count else 0
+
+
+def print_result(result, quiet=False):
+    """输出一个处理结果，失败信息输出到标准错误"""
+    if result.skipped:
+        return
+    if result.error is None:
+        if not quiet:
+            print(f"{result.source} -> {result.output}")
+    else:
+        print(f"{os.path.basename(result.source)} (预设 {result.preset_index + 1}): {result.error}",
+              file=sys.stderr)
+
+
+def summarize(report):
+    """一次处理的汇总信息"""
+    return (f"成功: {report.success_count} 个, 失败: {report.error_count} 个, "
+            f"未变化跳过: {report.skipped_count} 个, 缓存命中: {report.cached_count} 个, "
+            f"速度: {report.images_per_second():.1f} 张/秒 ({report.megabytes_per_second():.1f} MB/秒)")
+
+
+def run_jobs(jobs, args, memory_budget, cache, read_ahead):
+    """处理任务文件中的所有任务，输出每个任务和全部任务的汇总"""
+    reports = [RunReport(job.presets) for job in jobs]
+    for job_idx, result in compress_jobs(jobs, workers=args.workers, incremental=not args.force,
+                                         use_hash=args.use_hash, memory_budget=memory_budget,
+                                         dedup=args.dedup, cache=cache, read_ahead=read_ahead):
+        reports[job_idx].add(result)
+        print_result(result, args.quiet)
+
+    for job_idx, (job, report) in enumerate(zip(jobs, reports)):
+        report.finish()
+        if args.report:
+            base, ext = os.path.splitext(args.report)
+            report.write(f"{base}_{job_idx + 1}{ext}")
+        print(f"任务 {job_idx + 1} ({job.source} -> {job.output}): {summarize(report)}")
+    error_count = sum(report.error_count for report in reports)
+    print(f"全部 {len(jobs)} 个任务处理完成！成功: {sum(report.success_count for report in reports)} 个, "
+          f"失败: {error_count} 个, 未变化跳过: {sum(report.skipped_count for report in reports)} 个")
+    return 1 if error_count else 0
+
+
+if __name__ == "__main__":
+    # 打包为可执行文件时，子进程需要此调用
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""多个进程或多台机器共同处理同一个图片文件夹（通过共享文件系统协调，不依赖 Qt）
+
+各节点扫描同一个源文件夹，按图片相对路径的哈希把它们分到固定数量的块中（所有节点分得相同），
+再通过输出文件夹中的租约文件逐块认领：认领到的块由本节点处理，处理完成后写入完成标记。
+节点崩溃或失联时它的租约不再续期，到期后由其他节点接管。所有节点写入同一套 preset_* 输出文件夹，
+处理过程中各自把完成的任务追加到自己的日志中，保存时在锁内合并进共用的处理记录（见 OutputManifest 的 node 参数）。
+
+在多台机器（或同一台机器的多个终端）上运行相同的命令即可：
+
+    python compress_cli.py 共享图片文件夹 -o 共享输出文件夹 --distributed -j 8
+
+各机器的时钟需要同步（租约的到期时间按各自的系统时间判断）。
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import socket
+import hashlib
+import threading
+
+from image_pipeline import (READ_AHEAD_BYTES, IncrementalPlanner, ProcessingPool, TaskContext, preset_fingerprint,
+                            prepare_output_folders, scan_images, write_bytes)
+
+# 租约文件夹名称前缀（在输出文件夹中），后面加上块数和预设队列的指纹
+LEASE_DIR_PREFIX = ".image_compressor_leases"
+# 默认块数：块越多，节点之间的负载越均衡，但认领块的文件操作越多
+DEFAULT_CHUNKS = 256
+# 租约有效期（秒），持有者每隔三分之一有效期续期一次
+DEFAULT_LEASE_TTL = 120.0
+# 剩下的块都被其他节点持有时，等待多久再检查一次（秒）
+LEASE_POLL_INTERVAL = 5.0
+
+
+def default_node_id():
+    """默认节点名：主机名和进程号"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def relative_key(file_path, folder):
+    """图片相对于源文件夹的路径（以 / 分隔），各机器挂载位置不同时也相同"""
+    return os.path.relpath(file_path, folder).replace(os.sep, '/')
+
+
+def chunk_of(rel_path, chunks):
+    """图片所属的块序号"""
+    return zlib.crc32(rel_path.encode('utf-8')) % chunks
+
+
+def plan_chunks(folder, chunks, recursive=False, include=None, exclude=None, skip_dirs=()):
+    """扫描源文件夹，返回 {块序号: [文件路径]}，每块按相对路径排序"""
+    by_chunk = {}
+    for file_path in scan_images(folder, recursive, include, exclude, skip_dirs):
+        by_chunk.setdefault(chunk_of(relative_key(file_path, folder), chunks), []).append(file_path)
+    for paths in by_chunk.values():
+        paths.sort(key=lambda path: relative_key(path, folder))
+    return by_chunk
+
+
+def chunk_signature(folder, paths):
+    """块中图片的相对路径、大小和修改时间的摘要；块中的图片增删或修改后摘要随之变化"""
+    digest = hashlib.sha1()
+    for file_path in paths:
+        try:
+            stat = os.stat(file_path)
+            state = f"{stat.st_size}|{stat.st_mtime_ns}"
+        except OSError:
+            state = "missing"
+        digest.update(f"{relative_key(file_path, folder)}|{state}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def lease_dir_for(output_folder, presets, chunks):
+    """租约文件夹：块数或预设队列不同的处理使用不同的租约，互不影响"""
+    key = hashlib.sha1(json.dumps([preset_fingerprint(preset) for preset in presets]).encode('utf-8'))
+    return os.path.join(output_folder, f"{LEASE_DIR_PREFIX}_{chunks}_{key.hexdigest()[:12]}")
+
+
+class LeaseStore:
+    """共享文件系统上的块租约
+
+    认领块时以 O_CREAT | O_EXCL 创建租约文件，只有一个节点能创建成功。持有者定期改写租约中的到期时间
+    （先写临时文件再替换）；到期仍未续期的租约可以被其他节点接管：先把租约文件改名为本节点专属的名称
+    （改名是原子操作，只有一个节点能成功），确认它确实已经过期后再重新创建。块处理完成后写入完成标记，
+    其中记录块内容的摘要以及是否有图片处理失败，块中的图片变化后会被重新处理。
+    续期时发现租约已被接管（如本节点长时间卡住），不再续期该租约，也不写入完成标记；处理结果写入方式是幂等的，
+    此时同一块最多被重复处理一次，不会产生损坏的输出。
+    """
+
+    def __init__(self, lease_dir, node_id=None, ttl=DEFAULT_LEASE_TTL):
+        self.lease_dir = lease_dir
+        self.node_id = node_id or default_node_id()
+        self.ttl = ttl
+        os.makedirs(lease_dir, exist_ok=True)
+        # 块序号 -> 租约令牌
+        self._held = {}
+        # 续期时发现已被其他节点接管的块
+        self.lost = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _lease_path(self, chunk):
+        return os.path.join(self.lease_dir, f"chunk_{chunk:05d}.lease")
+
+    def _done_path(self, chunk):
+        return os.path.join(self.lease_dir, f"chunk_{chunk:05d}.done")
+
+    def _content(self, token):
+        return json.dumps({'owner': self.node_id, 'token': token, 'expires': time.time() + self.ttl})
+
+    def _read(self, path):
+        """读取租约，不存在时返回 None；内容不完整（持有者创建后崩溃）时按文件修改时间计算到期时间"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lease = json.load(f)
+            if isinstance(lease, dict) and 'expires' in lease:
+                return lease
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            pass
+        try:
+            return {'owner': None, 'token': None, 'expires': os.path.getmtime(path) + self.ttl}
+        except OSError:
+            return None
+
+    def _create(self, chunk, token):
+        """原子地创建租约文件，已存在时返回 False"""
+        try:
+            fd = os.open(self._lease_path(chunk), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(self._content(token))
+            f.flush()
+            os.fsync(f.fileno())
+        return True
+
+    def now(self):
+        """共享文件系统上的当前时间（新建文件的修改时间），与完成标记的修改时间可以直接比较"""
+        path = os.path.join(self.lease_dir, f".now.{uuid.uuid4().hex}")
+        try:
+            with open(path, 'w', encoding='utf-8'):
+                pass
+            return os.path.getmtime(path)
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def is_done(self, chunk, signature, since=None, incremental=True):
+        """块是否已按当前内容处理完成
+
+        since 之后（本次运行中）写入的完成标记总是有效，本次运行中已经失败过的块不再重试；
+        更早的完成标记只在 incremental 为 True 且块中所有图片都处理成功时有效。
+        """
+        path = self._done_path(chunk)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                lines = f.read().split()
+            written = os.path.getmtime(path)
+        except OSError:
+            return False
+        if not lines or lines[0] != signature:
+            return False
+        if since is not None and written >= since:
+            return True
+        return incremental and 'failed' not in lines[1:]
+
+    def try_acquire(self, chunk):
+        """尝试认领块（包括接管已过期的租约），成功时返回 True"""
+        token = uuid.uuid4().hex
+        path = self._lease_path(chunk)
+        if not self._create(chunk, token):
+            lease = self._read(path)
+            if lease is None or lease['expires'] > time.time():
+                return False
+            stale_path = f"{path}.{token}.stale"
+            try:
+                os.rename(path, stale_path)
+            except OSError:
+                # 其他节点抢先接管或释放了租约
+                return False
+            stale = self._read(stale_path)
+            if stale is not None and stale['expires'] > time.time():
+                # 读取之后租约已被续期或接管，放回原处（link 不会覆盖已存在的文件）
+                try:
+                    os.link(stale_path, path)
+                except OSError:
+                    pass
+                os.remove(stale_path)
+                return False
+            os.remove(stale_path)
+            if not self._create(chunk, token):
+                return False
+        with self._lock:
+            self._held[chunk] = token
+        return True
+
+    def renew(self):
+        """为持有的所有租约续期"""
+        with self._lock:
+            held = list(self._held.items())
+        for chunk, token in held:
+            path = self._lease_path(chunk)
+            lease = self._read(path)
+            if lease is None or lease.get('token') != token:
+                with self._lock:
+                    if self._held.get(chunk) == token:
+                        del self._held[chunk]
+                        self.lost.add(chunk)
+                continue
+            try:
+                tmp_path = f"{path}.{token}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(self._content(token))
+                os.replace(tmp_path, path)
+            except OSError:
+                # 共享文件系统暂时不可用，下次再试
+                pass
+
+    def release(self, chunk, signature=None, failed=False):
+        """释放租约；给出 signature 时先写入完成标记（failed 为 True 时标记中注明有图片处理失败）
+
+        租约已被其他节点接管时不写入完成标记，由接管的节点完成该块。返回是否写入了完成标记。
+        """
+        with self._lock:
+            token = self._held.pop(chunk, None)
+            lost = chunk in self.lost
+            self.lost.discard(chunk)
+        lease = self._read(self._lease_path(chunk))
+        if token is None or lost or lease is None or lease.get('token') != token:
+            return False
+        if signature is not None:
+            write_bytes(self._done_path(chunk), f"{signature}{' failed' if failed else ''}\n".encode('utf-8'))
+        try:
+            os.remove(self._lease_path(chunk))
+        except OSError:
+            pass
+        return signature is not None
+
+    def release_all(self):
+        """释放所有持有的租约（不写完成标记）"""
+        with self._lock:
+            chunks = list(self._held)
+        for chunk in chunks:
+            self.release(chunk)
+
+    def start(self):
+        """启动续期线程"""
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._renew_loop, daemon=True)
+        self._heartbeat.start()
+
+    def stop(self):
+        """停止续期线程"""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.ttl / 3):
+            self.renew()
+
+
+def compress_distributed(folder, presets, output_folder, node_id=None, chunks=DEFAULT_CHUNKS,
+                         lease_ttl=DEFAULT_LEASE_TTL, workers=1, cancel_event=None, recursive=False,
+                         include=None, exclude=None, incremental=True, use_hash=False, memory_budget=None,
+                         hooks=None, cache=None, poll_interval=LEASE_POLL_INTERVAL, read_ahead=READ_AHEAD_BYTES):
+    """作为一个节点与其他节点共同处理 folder，逐个产出本节点处理的 CompressResult
+
+    扫描 folder 并分块（见 plan_chunks），从节点名对应的位置开始依次认领尚未完成的块并处理，
+    所有节点从不同的位置开始，减少争抢。进程池需要更多任务时才认领下一块，各块的任务连续派发，
+    块与块之间进程池不会空闲；块中最后一个文件处理完成时释放该块。
+    剩下的块都被其他节点持有时每 poll_interval 秒检查一次，直到所有块都已完成（其他节点崩溃时，
+    它的块在租约到期后由本节点接管）。
+    incremental 为 False 时重新处理所有块，只跳过本次运行中其他节点已完成的块；有图片处理失败的块
+    在本次运行中不再重试，下次运行时重新处理。
+    所有节点的 presets、chunks 以及 recursive/include/exclude 必须相同。其余参数与 compress() 相同。
+    """
+    presets = [dict(preset) for preset in presets]
+    preset_folders = prepare_output_folders(output_folder, presets)
+    source_root = folder if recursive else None
+    store = LeaseStore(lease_dir_for(output_folder, presets, chunks), node_id, lease_ttl)
+    cancel_event = cancel_event or threading.Event()
+
+    by_chunk = plan_chunks(folder, chunks, recursive, include, exclude, skip_dirs=[output_folder])
+    order = sorted(by_chunk)
+    if order:
+        start = chunk_of(store.node_id, len(order))
+        order = order[start:] + order[:start]
+    signatures = {}
+    # 本次运行的开始时间（共享文件系统的时间），此后写入的完成标记来自本次运行
+    started = store.now()
+
+    planner = IncrementalPlanner(presets, preset_folders, use_hash, source_root, skip_unchanged=incremental,
+                                 node=store.node_id)
+    context = TaskContext(presets, preset_folders, source_root)
+    # 已认领的块 -> {'left': 尚未产出结果的文件数, 'planned': 是否已派发完, 'failed': 是否有图片处理失败}
+    active = {}
+    # 文件路径 -> 所属的块
+    owners = {}
+
+    def finish(chunk):
+        state = active.pop(chunk)
+        store.release(chunk, signatures[chunk], state['failed'])
+
+    def claim(remaining, waiting):
+        """依次认领 remaining 中尚未完成的块，产出它们的任务；被其他节点持有的块放入 waiting"""
+        for chunk in remaining:
+            if cancel_event.is_set():
+                return
+            if chunk not in signatures:
+                signatures[chunk] = chunk_signature(folder, by_chunk[chunk])
+            if store.is_done(chunk, signatures[chunk], started, incremental):
+                continue
+            if not store.try_acquire(chunk):
+                waiting.append(chunk)
+                continue
+            # 认领后再检查一次：可能在检查完成标记和认领之间被其他节点处理完毕
+            if store.is_done(chunk, signatures[chunk], started, incremental):
+                store.release(chunk)
+                continue
+            state = active[chunk] = {'left': 0, 'planned': False, 'failed': False}
+            for file_path, only in planner.plan(by_chunk[chunk]):
+                owners[file_path] = chunk
+                state['left'] += 1
+                yield file_path, only, context
+            state['planned'] = True
+            if state['left'] == 0:
+                finish(chunk)
+
+    pool = ProcessingPool(workers, memory_budget, read_ahead)
+    store.start()
+    completed = False
+    try:
+        remaining = order
+        while remaining and not cancel_event.is_set():
+            waiting = []
+            for file_path, _, results in pool.run_tasks(claim(remaining, waiting), cancel_event, hooks, cache):
+                chunk = owners.pop(file_path)
+                state = active[chunk]
+                for result in results:
+                    planner.record(result)
+                    state['failed'] = state['failed'] or result.error is not None
+                    yield result
+                state['left'] -= 1
+                if state['planned'] and state['left'] == 0:
+                    finish(chunk)
+            remaining = waiting
+            if remaining:
+                cancel_event.wait(poll_interval)
+        completed = not cancel_event.is_set()
+    finally:
+        store.stop()
+        store.release_all()
+        pool.shutdown()
+        # 其他节点可能仍在写入临时文件，只清理超过租约有效期的
+        planner.finish(prune=completed, tmp_max_age=lease_ttl)
+        if cache is not None:
+            cache.trim()
@@ -0,0 +1,270 @@
+"""图片浏览面板：虚拟化的文件列表和后台生成的缩略图
+
+列表基于 Qt 的模型/视图，只为可见的行请求缩略图，十万张以上的图片也能保持流畅。
+缩略图在后台线程中用 draft() 低成本解码生成，保存在内存 LRU 和磁盘缓存中。
+"""
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtWidgets import QListView, QAbstractItemView
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QObject, QSize, QThread, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap
+
+from image_pipeline import load_pillow, scan_images, write_bytes
+
+# 缩略图边长（像素）
+THUMBNAIL_SIZE = 96
+# 磁盘缩略图缓存位置
+THUMBNAIL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".image_compressor_thumbnails")
+# 内存中最多保留的缩略图数量
+THUMBNAIL_MEMORY_ITEMS = 2000
+# 等待生成的缩略图请求上限，超过时丢弃最早的请求（滚动时早先可见的行多半已不可见）
+THUMBNAIL_MAX_PENDING = 256
+# 扫描文件夹时每批加入列表的文件数
+SCAN_BATCH_SIZE = 500
+
+
+def thumbnail_cache_path(file_path, stat, size=THUMBNAIL_SIZE, cache_dir=THUMBNAIL_CACHE_DIR):
+    """按文件路径、大小、修改时间和缩略图尺寸计算磁盘缓存路径，源文件变化后自动失效"""
+    key = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{size}"
+    digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, digest[:2], digest + '.png')
+
+
+def make_thumbnail(file_path, size=THUMBNAIL_SIZE):
+    """生成缩略图，返回 PNG 编码的字节；JPEG 通过 draft() 直接按缩小后的尺寸解码"""
+    with load_pillow().open(file_path) as img:
+        img.draft('RGB', (size, size))
+        img.thumbnail((size, size))
+        img = img.convert('RGBA' if img.has_transparency_data else 'RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class ThumbnailLoader(QObject):
+    """在后台线程中生成缩略图
+
+    request() 把请求压入栈中，工作线程总是先处理最近的请求（当前可见的行）。
+    生成的缩略图写入磁盘缓存，以 QImage 通过 thumbnail_ready 信号发回界面线程。
+    """
+
+    # 文件路径, 缩略图（生成失败时为空 QImage）
+    thumbnail_ready = pyqtSignal(str, QImage)
+
+    def __init__(self, threads=2, parent=None):
+        super().__init__(parent)
+        self._pending = OrderedDict()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._workers = [threading.Thread(target=self._work, daemon=True) for _ in range(threads)]
+        for worker in self._workers:
+            worker.start()
+
+    def request(self, file_path):
+        """请求生成缩略图，重复请求会移到栈顶"""
+        with self._condition:
+            self._pending.pop(file_path, None)
+            self._pending[file_path] = None
+            while len(self._pending) > THUMBNAIL_MAX_PENDING:
+                self._pending.popitem(last=False)
+            self._condition.notify()
+
+    def clear(self):
+        """丢弃尚未开始的请求"""
+        with self._condition:
+            self._pending.clear()
+
+    def stop(self):
+        """停止工作线程"""
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                file_path, _ = self._pending.popitem(last=True)
+            self.thumbnail_ready.emit(file_path, self._load(file_path))
+
+    @staticmethod
+    def _load(file_path):
+        """读取磁盘缓存，没有时生成缩略图并写入缓存"""
+        try:
+            cache_file = thumbnail_cache_path(file_path, os.stat(file_path))
+            image = QImage(cache_file)
+            if image.isNull():
+                data = make_thumbnail(file_path)
+                try:
+                    write_bytes(cache_file, data)
+                except OSError:
+                    pass
+                image = QImage.fromData(data, 'PNG')
+            return image
+        except Exception:
+            return QImage()
+
+
+class FolderScanner(QThread):
+    """在后台线程中扫描文件夹，分批报告找到的图片"""
+
+    # 一批图片路径
+    found = pyqtSignal(list)
+
+    def __init__(self, folder, recursive=False, skip_dirs=(), parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self.recursive = recursive
+        self.skip_dirs = skip_dirs
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        batch = []
+        try:
+            for file_path in scan_images(self.folder, self.recursive, skip_dirs=self.skip_dirs):
+                if self._cancelled:
+                    return
+                batch.append(file_path)
+                if len(batch) >= SCAN_BATCH_SIZE:
+                    self.found.emit(batch)
+                    batch = []
+        except OSError:
+            pass
+        if batch and not self._cancelled:
+            self.found.emit(batch)
+
+
+class ImageListModel(QAbstractListModel):
+    """图片文件列表模型，缩略图按需加载
+
+    只有视图请求某一行的图标（即该行可见）时才请求生成缩略图，已生成的缩略图保存在内存 LRU 中。
+    每次绘制可见行都会重新请求，使它们排在请求栈顶；已不可见的旧请求会被丢弃。
+    """
+
+    def __init__(self, root="", parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.paths = []
+        self._rows = {}
+        self._pixmaps = OrderedDict()
+        # 无法生成缩略图的文件，不再重复请求
+        self._failed = set()
+        self.loader = ThumbnailLoader(parent=self)
+        self.loader.thumbnail_ready.connect(self._on_thumbnail_ready)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        file_path = self.paths[index.row()]
+        if role == Qt.DisplayRole:
+            return os.path.relpath(file_path, self.root) if self.root else os.path.basename(file_path)
+        if role == Qt.ToolTipRole:
+            return file_path
+        if role == Qt.DecorationRole:
+            pixmap = self._pixmaps.get(file_path)
+            if pixmap is not None:
+                self._pixmaps.move_to_end(file_path)
+                return pixmap
+            if file_path not in self._failed:
+                self.loader.request(file_path)
+        return None
+
+    def reset(self, root=""):
+        """清空列表"""
+        self.beginResetModel()
+        self.root = root
+        self.paths = []
+        self._rows = {}
+        self._failed.clear()
+        self.loader.clear()
+        self.endResetModel()
+
+    def append_paths(self, paths):
+        """在列表末尾加入一批图片"""
+        start = len(self.paths)
+        self.beginInsertRows(QModelIndex(), start, start + len(paths) - 1)
+        for offset, file_path in enumerate(paths):
+            self._rows[file_path] = start + offset
+        self.paths.extend(paths)
+        self.endInsertRows()
+
+    def _on_thumbnail_ready(self, file_path, image):
+        row = self._rows.get(file_path)
+        if row is None or file_path in self._pixmaps:
+            return
+        if image.isNull():
+            self._failed.add(file_path)
+            return
+        self._pixmaps[file_path] = QPixmap.fromImage(image)
+        while len(self._pixmaps) > THUMBNAIL_MEMORY_ITEMS:
+            self._pixmaps.popitem(last=False)
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def shutdown(self):
+        self.loader.stop()
+
+
+class FileBrowser(QListView):
+    """图片浏览面板：显示文件夹中的图片和缩略图，可以多选"""
+
+    # 扫描到的图片总数
+    count_changed = pyqtSignal(int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.image_model = ImageListModel(parent=self)
+        self.setModel(self.image_model)
+        self.setIconSize(QSize(THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        # 所有行高度相同，视图不需要逐行计算尺寸；分批布局避免一次布局全部行
+        self.setUniformItemSizes(True)
+        self.setLayoutMode(QListView.Batched)
+        self.setBatchSize(200)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self._scanner = None
+
+    def load_folder(self, folder, recursive=False, skip_dirs=()):
+        """在后台扫描文件夹，边扫描边显示"""
+        self._stop_scanner()
+        self.image_model.reset(folder)
+        self.count_changed.emit(0)
+        self._scanner = FolderScanner(folder, recursive, skip_dirs, parent=self)
+        self._scanner.found.connect(self._on_found)
+        self._scanner.start()
+
+    def _on_found(self, paths):
+        if self.sender() is not self._scanner:
+            return
+        self.image_model.append_paths(paths)
+        self.count_changed.emit(len(self.image_model.paths))
+
+    def _stop_scanner(self):
+        if self._scanner is not None:
+            self._scanner.cancel()
+            self._scanner.wait()
+            self._scanner = None
+
+    def selected_paths(self):
+        """返回选中的图片路径（按列表顺序）"""
+        rows = sorted(index.row() for index in self.selectionModel().selectedIndexes())
+        return [self.image_model.paths[row] for row in rows]
+
+    def shutdown(self):
+        """停止扫描和缩略图线程"""
+        self._stop_scanner()
+        self.image_model.shutdown()
@@ -1,24 +1,352 @@
+import time
+# 启动计时起点（--startup-time 模式下报告导入和首次绘制耗时）
+STARTUP_BEGIN = time.perf_counter()
 import sys
 import os
-import json
+import functools
 import random
+import threading
+import multiprocessing
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QLabel, QPushButton, QFileDialog, QMessageBox, QSpinBox,
+                             QLabel, QPushButton, QFileDialog, QMessageBox, QSpinBox, QComboBox,
                              QListWidget,  QGroupBox, QFormLayout, QCheckBox,
                              QFrame, QSplitter, QProgressDialog,  QInputDialog,
                              QMenu, QAction)
-from PyQt5.QtCore import Qt, QTimer
+from PyQt5.QtCore import Qt, QEvent, QTimer, QThread, pyqtSignal
 from PyQt5.QtGui import (QFont, QIcon, QColor, QPainter, QPen, QBrush,
-                         QLinearGradient,)
-from PIL import Image
+                         QLinearGradient, QPixmap)
+from image_pipeline import (DEFAULT_CACHE_DIR, DEFAULT_CACHE_SIZE, DEFAULT_PRESETS_FILE, OutputCache, PRESET_DEFAULTS, SUBSAMPLING_OPTIONS, ProcessingPool,
+                            RunReport, available_output_formats, compress,
+                            default_memory_budget, describe_preset, load_presets, preset_option,
+                            prepare_output_folders, save_presets, scan_images, watch)
+
+from file_browser import FileBrowser
+
+# 处理报告文件名（保存在输出文件夹中）
+REPORT_NAME = "image_compressor_report"
+# 处理进度刷新到界面的最短间隔（秒），无论图片处理多快，界面每秒最多更新 10 次
+PROGRESS_INTERVAL = 0.1
+# 设置此环境变量为 1 时默认启用低功耗模式（关闭背景动画定时器）
+LOW_POWER_ENV = "IMAGE_COMPRESSOR_LOW_POWER"
+# 使用此命令行参数启动时，打印导入、创建窗口和首次绘制的耗时后退出
+STARTUP_TIME_ARG = "--startup-time"
+# 界面字体
+UI_FONT_FAMILY = "Microsoft YaHei UI"
+
+# 主窗口样式表
+STYLE_SHEET = """
+    QMainWindow { 
+        background-color: #ffffff;
+    }
+    
+    /* 基础GroupBox样式 */
+    QGroupBox {
+        border: 1px solid #b3d1ff;
+        border-radius: 12px;
+        padding: 15px;
+        background-color: rgba(255, 255, 255, 0.9);
+        margin: 0;
+    }
+    
+    /* 区域特定样式 */
+    #paramGroup {
+        border-color: #90caf9;
+    }
+    
+    #presetGroup {
+        border-color: #64b5f6;
+    }
+    
+    #queueGroup {
+        border-color: #42a5f5;
+    }
+    
+    /* 标题标签样式 */
+    .section-title {
+        color: #0a4da2;
+        font-weight: bold;
+        font-family: 'Microsoft YaHei UI';
+        font-size: 12pt;
+        margin-bottom: 5px;
+        padding-left: 5px;
+    }
+    
+    QPushButton {
+        background-color: #1e88e5;
+        color: #ffffff;
+        border-radius: 8px;
+        padding: 12px 24px;
+        font-weight: 600;
+        font-size: 12pt;
+        border: 1px solid #64b5f6;
+        font-family: 'Microsoft YaHei UI';
+    }
+    
+    QPushButton:hover { 
+        background-color: #42a5f5;
+        border-color: #90caf9;
+    }
+    
+    QPushButton:pressed { 
+        background-color: #1565c0;
+    }
+    
+    QPushButton:disabled { 
+        background-color: #e3f2fd;
+        border-color: #bbdefb;
+        color: #90caf9;
+    }
+    
+    QSpinBox, QComboBox, QSlider {
+        border: 1px solid #b3d1ff;
+        border-radius: 6px;
+        padding: 8px;
+        background-color: #f0f7ff;
+        color: #0d47a1;
+        font-family: 'Microsoft YaHei UI';
+    }
+    
+    QSpinBox:hover, QComboBox:hover, QSlider:hover {
+        border-color: #64b5f6;
+    }
+    
+    QListWidget {
+        border: 1px solid #b3d1ff;
+        border-radius: 8px;
+        padding: 10px;
+        background-color: #f0f7ff;
+        alternate-background-color: #e3f2fd;
+        color: #0d47a1;
+        font-family: 'Microsoft YaHei UI';
+    }
+    
+    QListWidget::item {
+        padding: 8px;
+        border-radius: 4px;
+    }
+    
+    QListWidget::item:selected {
+        background-color: #1e88e5;
+        color: #ffffff;
+    }
+    
+    QLabel { 
+        color: #0d47a1;
+        font-family: 'Microsoft YaHei UI';
+    }
+    
+    QCheckBox { 
+        color: #0d47a1;
+        font-size: 11pt;
+        spacing: 8px;
+        font-family: 'Microsoft YaHei UI';
+    }
+    
+    QMenuBar { 
+        background-color: #f0f7ff;
+        border-bottom: 1px solid #bbdefb;
+    }
+    
+    QMenuBar::item { 
+        background-color: transparent;
+        padding: 6px 12px;
+        font-family: 'Microsoft YaHei UI';
+        color: #0d47a1;
+    }
+    
+    QMenuBar::item:selected { 
+        background-color: #e3f2fd;
+        border-radius: 4px;
+    }
+    
+    QMenu { 
+        background-color: #f0f7ff;
+        border: 1px solid #bbdefb;
+        border-radius: 8px;
+        padding: 4px 0;
+        font-family: 'Microsoft YaHei UI';
+        color: #0d47a1;
+    }
+    
+    QMenu::item { 
+        padding: 8px 24px;
+        color: #0d47a1;
+    }
+    
+    QMenu::item:selected { 
+        background-color: #42a5f5;
+        color: white;
+        border-radius: 4px;
+    }
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def ui_font(point_size=-1, bold=False):
+    """返回界面字体，相同参数的字体只创建一次（需要在创建 QApplication 之后调用）"""
+    return QFont(UI_FONT_FAMILY, point_size, QFont.Bold if bold else -1)
+
+
+class ProcessingEngine(QThread):
+    """多进程图片处理引擎
+
+    在后台线程中通过 compress() 把任务分发到 ProcessingPool 进程池，通过信号向窗口报告进度。
+    后台线程只把处理结果放入缓冲区，界面线程的定时器每 PROGRESS_INTERVAL 秒取走并发送一次，
+    界面刷新频率与图片处理速度无关，处理一张很慢的大图时之前完成的结果也会按时显示。
+    进程池在多次处理之间保持运行（预热），取消时停止派发并等待已在执行的任务完成。
+    start_watch() 持续监视文件夹并处理新增的图片，直到取消。
+    """
+
+    # 已完成数量, 总数（仍在扫描文件夹时为 0）, 最近完成的文件名, 最近一段时间的速度（项/秒）
+    progress = pyqtSignal(int, int, str, float)
+    # 自上次报告以来完成的 (文件, 预设) 的 CompressResult 列表
+    results_ready = pyqtSignal(list)
+    # 是否被取消
+    run_finished = pyqtSignal(bool)
+
+    def __init__(self, max_workers=None, parent=None):
+        super().__init__(parent)
+        self.pool = ProcessingPool(max_workers)
+        self._cancel_event = threading.Event()
+        self.image_files = []
+        self.presets = []
+        self.output_folder = ""
+        self.incremental = False
+        self.source_root = None
+        self.dedup = False
+        self.cache = None
+        # 监视的文件夹（None 表示处理一批图片）
+        self.watch_folder = None
+        # 本次处理找到的图片数量，扫描是否已完成，以及导致处理中止的错误
+        self.found_count = 0
+        self.scan_finished = False
+        self.run_error = None
+        # 后台线程完成的结果，由界面线程的定时器取走；_done_count 为已完成总数
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        self._done_count = 0
+        self._last_report = time.perf_counter()
+        self._flush_timer = QTimer(self)
+        self._flush_timer.setInterval(int(PROGRESS_INTERVAL * 1000))
+        self._flush_timer.timeout.connect(self._flush)
+        # 线程结束后（在界面线程中）发送剩余结果，再发出 run_finished
+        self.finished.connect(self._on_thread_finished)
+
+    @property
+    def max_workers(self):
+        return self.pool.max_workers
+
+    def set_worker_count(self, max_workers):
+        """设置工作进程数，下次处理时生效"""
+        if not self.isRunning():
+            self.pool.set_worker_count(max_workers)
+
+    def start_run(self, image_files, presets, output_folder, incremental=False, source_root=None,
+                  dedup=False, cache=None):
+        """开始处理一批图片
+
+        image_files 可以是生成器（如 scan_images），会在后台线程中边扫描边处理。
+        """
+        self._prepare(image_files, presets, output_folder, incremental, source_root, dedup, cache)
+        self._flush_timer.start()
+        self.start()
+
+    def start_watch(self, folder, presets, output_folder, recursive=False, incremental=True,
+                    dedup=False, cache=None):
+        """开始监视文件夹，新图片写入完成后自动处理，直到调用 cancel()"""
+        self._prepare([], presets, output_folder, incremental, folder if recursive else None, dedup, cache,
+                      watch_folder=folder)
+        self._flush_timer.start()
+        self.start()
+
+    def _prepare(self, image_files, presets, output_folder, incremental, source_root, dedup, cache,
+                 watch_folder=None):
+        """设置下一次处理的参数（必须在 start() 之前全部设置好，run() 在后台线程中读取）"""
+        self.image_files = image_files
+        self.presets = [dict(preset) for preset in presets]
+        self.output_folder = output_folder
+        self.incremental = incremental
+        self.source_root = source_root
+        self.dedup = dedup
+        self.cache = cache
+        self.watch_folder = watch_folder
+        self.found_count = 0
+        self.scan_finished = False
+        self.run_error = None
+        self._buffer = []
+        self._done_count = 0
+        self._last_report = time.perf_counter()
+        self._cancel_event.clear()
+
+    def cancel(self):
+        """请求取消：不再派发新任务，已在执行的任务会处理完毕"""
+        self._cancel_event.set()
+
+    def shutdown(self):
+        """关闭进程池"""
+        self.pool.shutdown()
+
+    def _count_files(self):
+        """边扫描边统计找到的图片数量"""
+        for file_path in self.image_files:
+            self.found_count += 1
+            yield file_path
+        self.scan_finished = True
+
+    def run(self):
+        if self.watch_folder is not None:
+            results = watch(self.watch_folder, self.presets, self.output_folder, self._cancel_event,
+                            recursive=self.source_root is not None, pool=self.pool,
+                            incremental=self.incremental, dedup=self.dedup, cache=self.cache)
+        else:
+            results = compress(self._count_files(), self.presets, self.output_folder,
+                               cancel_event=self._cancel_event, incremental=self.incremental,
+                               pool=self.pool, source_root=self.source_root, dedup=self.dedup,
+                               cache=self.cache)
+        try:
+            for result in results:
+                with self._buffer_lock:
+                    self._buffer.append(result)
+                    self._done_count += 1
+        except Exception as e:
+            self.run_error = str(e)
+
+    def _flush(self):
+        """（界面线程）发送自上次报告以来的处理结果"""
+        with self._buffer_lock:
+            batch, self._buffer = self._buffer, []
+            done_count = self._done_count
+        if batch:
+            now = time.perf_counter()
+            elapsed = now - self._last_report
+            self._report(batch, done_count, len(batch) / elapsed if elapsed > 0 else 0.0)
+            self._last_report = now
+
+    def _on_thread_finished(self):
+        self._flush_timer.stop()
+        self._flush()
+        self.run_finished.emit(self._cancel_event.is_set())
+
+    def _report(self, batch, done_count, rate):
+        """发送一批处理结果和进度"""
+        total = self.found_count * len(self.presets) if self.scan_finished else 0
+        self.results_ready.emit(batch)
+        self.progress.emit(done_count, total, os.path.basename(batch[-1].source), rate)
+
 
 class SciFiBackground(QWidget):
+    """科幻风格背景
+
+    渐变、网格和光点预先绘制到与窗口同样大小的 QPixmap 中，只在尺寸变化后重新绘制，
+    每次重绘只需复制这张图。
+    """
 
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setMinimumSize(800, 600)
         self.parent = parent
         self.points = []
+        self._cache = None
         self.generate_random_points()
         
     def generate_random_points(self):
@@ -31,10 +359,21 @@ class SciFiBackground(QWidget):
             
     def resizeEvent(self, event):
         self.generate_random_points()
+        self._cache = None
         super().resizeEvent(event)
             
     def paintEvent(self, event):
+        if self._cache is None or self._cache.size() != self.size() * self.devicePixelRatioF():
+            self._cache = self.render_background()
         painter = QPainter(self)
+        painter.drawPixmap(0, 0, self._cache)
+
+    def render_background(self):
+        """把背景绘制到与控件同样大小的 QPixmap 中"""
+        ratio = self.devicePixelRatioF()
+        pixmap = QPixmap(self.size() * ratio)
+        pixmap.setDevicePixelRatio(ratio)
+        painter = QPainter(pixmap)
         painter.setRenderHint(QPainter.Antialiasing)
         
         gradient = QLinearGradient(0, 0, self.width(), self.height())
@@ -52,18 +391,29 @@ class SciFiBackground(QWidget):
         for x, y, size in self.points:
             painter.setPen(QPen(QColor(66, 165, 245, 150), size))
             painter.drawPoint(x, y)
+        painter.end()
+        return pixmap
 
 class ImageCompressor(QMainWindow):
-    def __init__(self):
+    def __init__(self, startup_times=None):
         super().__init__()
+        # 启动各阶段的时间点（--startup-time 模式），以及窗口是否已完成首次绘制
+        self.startup_times = startup_times
+        self.first_painted = False
         # 存储多组比例设置 (width, height, quality, crop)
         self.ratio_presets = []  
         # 存储保存的尺寸预设
         self.size_presets = {}
         # 预设文件路径
-        self.presets_file = os.path.join(os.path.expanduser("~"), ".image_compressor_presets.json")
+        self.presets_file = DEFAULT_PRESETS_FILE
         # 处理队列 - 存储预设配置
         self.process_queue = []
+        # 多进程处理引擎（进程池在多次处理之间复用）
+        self.engine = ProcessingEngine(parent=self)
+        self.engine.results_ready.connect(self.on_results_ready)
+        self.engine.progress.connect(self.on_processing_progress)
+        self.engine.run_finished.connect(self.on_processing_finished)
+        self.progress_dialog = None
         
         self.init_ui()
         self.folder_path = ""
@@ -71,10 +421,15 @@ class ImageCompressor(QMainWindow):
         self.load_size_presets()
         
         # 科幻风格动画定时器
+        # 窗口隐藏、最小化、正在处理或启用低功耗模式时停止，避免空闲时频繁唤醒
         self.animation_timer = QTimer(self)
+        self.animation_timer.setInterval(50)  # 每50ms更新一次动画
         self.animation_timer.timeout.connect(self.update_animation)
-        self.animation_timer.start(50)  # 每50ms更新一次动画
         self.animation_frame = 0
+        self.batch_running = False
+        self.update_animation_timer()
+        if self.startup_times is not None:
+            self.startup_times['built'] = time.perf_counter()
 
     def init_ui(self):
         # 窗口基础设置
@@ -83,8 +438,7 @@ class ImageCompressor(QMainWindow):
         
         
         # 全局字体和样式
-        font = QFont("Microsoft YaHei UI", 18, QFont.Bold)
-        self.setFont(font)
+        self.setFont(ui_font(18, bold=True))
         
         # 创建装饰性背景组件 - 科幻风格
         self.decorative_bg = SciFiBackground(self)
@@ -92,150 +446,8 @@ class ImageCompressor(QMainWindow):
         self.decorative_bg.lower()  # 置于底层
         
         # 样式表
-        self.setStyleSheet("""
-            QMainWindow { 
-                background-color: #ffffff;
-            }
-            
-            /* 基础GroupBox样式 */
-            QGroupBox {
-                border: 1px solid #b3d1ff;
-                border-radius: 12px;
-                padding: 15px;
-                background-color: rgba(255, 255, 255, 0.9);
-                margin: 0;
-            }
-            
-            /* 区域特定样式 */
-            #paramGroup {
-                border-color: #90caf9;
-            }
-            
-            #presetGroup {
-                border-color: #64b5f6;
-            }
-            
-            #queueGroup {
-                border-color: #42a5f5;
-            }
-            
-            /* 标题标签样式 */
-            .section-title {
-                color: #0a4da2;
-                font-weight: bold;
-                font-family: 'Microsoft YaHei UI';
-                font-size: 12pt;
-                margin-bottom: 5px;
-                padding-left: 5px;
-            }
-            
-            QPushButton {
-                background-color: #1e88e5;
-                color: #ffffff;
-                border-radius: 8px;
-                padding: 12px 24px;
-                font-weight: 600;
-                font-size: 12pt;
-                border: 1px solid #64b5f6;
-                font-family: 'Microsoft YaHei UI';
-            }
-            
-            QPushButton:hover { 
-                background-color: #42a5f5;
-                border-color: #90caf9;
-            }
-            
-            QPushButton:pressed { 
-                background-color: #1565c0;
-            }
-            
-            QPushButton:disabled { 
-                background-color: #e3f2fd;
-                border-color: #bbdefb;
-                color: #90caf9;
-            }
-            
-            QSpinBox, QSlider {
-                border: 1px solid #b3d1ff;
-                border-radius: 6px;
-                padding: 8px;
-                background-color: #f0f7ff;
-                color: #0d47a1;
-                font-family: 'Microsoft YaHei UI';
-            }
-            
-            QSpinBox:hover, QSlider:hover {
-                border-color: #64b5f6;
-            }
-            
-            QListWidget {
-                border: 1px solid #b3d1ff;
-                border-radius: 8px;
-                padding: 10px;
-                background-color: #f0f7ff;
-                alternate-background-color: #e3f2fd;
-                color: #0d47a1;
-                font-family: 'Microsoft YaHei UI';
-            }
-            
-            QListWidget::item {
-                padding: 8px;
-                border-radius: 4px;
-            }
-            
-            QListWidget::item:selected {
-                background-color: #1e88e5;
-                color: #ffffff;
-            }
-            
-            QLabel { 
-                color: #0d47a1;
-                font-family: 'Microsoft YaHei UI';
-            }
-            
-            QCheckBox { 
-                color: #0d47a1;
-                spacing: 8px;
-                font-family: 'Microsoft YaHei UI';
-            }
-            
-            QMenuBar { 
-                background-color: #f0f7ff;
-                border-bottom: 1px solid #bbdefb;
-            }
-            
-            QMenuBar::item { 
-                background-color: transparent;
-                padding: 6px 12px;
-                font-family: 'Microsoft YaHei UI';
-                color: #0d47a1;
-            }
-            
-            QMenuBar::item:selected { 
-                background-color: #e3f2fd;
-                border-radius: 4px;
-            }
-            
-            QMenu { 
-                background-color: #f0f7ff;
-                border: 1px solid #bbdefb;
-                border-radius: 8px;
-                padding: 4px 0;
-                font-family: 'Microsoft YaHei UI';
-                color: #0d47a1;
-            }
-            
-            QMenu::item { 
-                padding: 8px 24px;
-                color: #0d47a1;
-            }
-            
-            QMenu::item:selected { 
-                background-color: #42a5f5;
-                color: white;
-                border-radius: 4px;
-            }
-        """)
+        # 样式表（整个窗口只设置一次，子部件不再单独设置相同的样式）
+        self.setStyleSheet(STYLE_SHEET)
 
         # 中心部件和主布局
         central_widget = QWidget()
@@ -246,7 +458,7 @@ class ImageCompressor(QMainWindow):
         
         # 标题和分隔线
         title_label = QLabel("图片压缩工具")
-        title_label.setFont(QFont("Microsoft YaHei UI", 36, QFont.Bold))
+        title_label.setFont(ui_font(36, bold=True))
         title_label.setAlignment(Qt.AlignCenter)
         title_label.setStyleSheet("""
             color: #0a4da2; 
@@ -256,7 +468,7 @@ class ImageCompressor(QMainWindow):
         
         # 副标题
         subtitle_label = QLabel("@Kighter123")
-        subtitle_label.setFont(QFont("Microsoft YaHei UI", 12))
+        subtitle_label.setFont(ui_font(12))
         subtitle_label.setAlignment(Qt.AlignCenter)
         subtitle_label.setStyleSheet("color: #1565c0; margin-bottom: 10px;")
         main_layout.addWidget(subtitle_label)
@@ -370,11 +582,93 @@ class ImageCompressor(QMainWindow):
         self.quality_spin.setMinimumHeight(40)
         current_ratio_form.addRow("压缩质量 (10-100):", self.quality_spin)
         
+        # 文件大小上限：超过时自动降低压缩质量（对 JPEG、WebP、AVIF 有效）
+        self.max_kb_spin = QSpinBox()
+        self.max_kb_spin.setRange(0, 100000)
+        self.max_kb_spin.setValue(0)
+        self.max_kb_spin.setSpecialValueText("不限制")
+        self.max_kb_spin.setSuffix(" KB")
+        self.max_kb_spin.setMinimumHeight(40)
+        current_ratio_form.addRow("文件大小上限:", self.max_kb_spin)
+        
         self.crop_checkbox = QCheckBox("比例不匹配时启用智能居中裁剪")
         self.crop_checkbox.setChecked(True)
-        self.crop_checkbox.setStyleSheet("font-size: 11pt;")
         current_ratio_form.addRow(self.crop_checkbox)
         
+        # 输出格式和编码器设置（随预设保存）
+        # 可用格式需要加载 Pillow 的所有编码插件才能确定，窗口显示后再加入（见 load_output_formats）
+        self.format_combo = QComboBox()
+        self.format_combo.addItem("与源文件相同", '')
+        self.output_formats_loaded = False
+        self.format_combo.setMinimumHeight(40)
+        current_ratio_form.addRow("输出格式:", self.format_combo)
+        
+        self.subsampling_combo = QComboBox()
+        self.subsampling_combo.addItem("默认", '')
+        for subsampling in SUBSAMPLING_OPTIONS:
+            self.subsampling_combo.addItem(subsampling, subsampling)
+        self.subsampling_combo.setMinimumHeight(40)
+        current_ratio_form.addRow("JPEG 色度采样:", self.subsampling_combo)
+        
+        self.progressive_checkbox = QCheckBox("JPEG 渐进式编码")
+        current_ratio_form.addRow(self.progressive_checkbox)
+        
+        self.optimize_checkbox = QCheckBox("JPEG 优化编码表（文件更小，编码稍慢）")
+        self.optimize_checkbox.setChecked(True)
+        current_ratio_form.addRow(self.optimize_checkbox)
+        
+        self.method_spin = QSpinBox()
+        self.method_spin.setRange(0, 6)
+        self.method_spin.setValue(PRESET_DEFAULTS['method'])
+        self.method_spin.setMinimumHeight(40)
+        current_ratio_form.addRow("WebP/AVIF 编码耗时 (0-6):", self.method_spin)
+        
+        self.animation_checkbox = QCheckBox("保留动图的所有帧（GIF、APNG、WebP）")
+        self.animation_checkbox.setChecked(PRESET_DEFAULTS['animation'])
+        current_ratio_form.addRow(self.animation_checkbox)
+        
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, max(64, os.cpu_count() or 1))
+        self.workers_spin.setValue(self.engine.max_workers)
+        self.workers_spin.setMinimumHeight(40)
+        current_ratio_form.addRow("并行进程数:", self.workers_spin)
+        
+        # 同时处理的图片估算内存上限，避免超大图片耗尽内存
+        self.memory_budget_spin = QSpinBox()
+        self.memory_budget_spin.setRange(0, 1024 * 1024)
+        self.memory_budget_spin.setValue(0)
+        self.memory_budget_spin.setSpecialValueText("自动")
+        self.memory_budget_spin.setSuffix(" MB")
+        self.memory_budget_spin.setMinimumHeight(40)
+        current_ratio_form.addRow("内存预算:", self.memory_budget_spin)
+        
+        self.incremental_checkbox = QCheckBox("跳过未变化的图片（增量处理）")
+        self.incremental_checkbox.setChecked(True)
+        current_ratio_form.addRow(self.incremental_checkbox)
+        
+        self.dedup_checkbox = QCheckBox("跳过重复图片（内容相同只处理一张）")
+        current_ratio_form.addRow(self.dedup_checkbox)
+        
+        self.low_power_checkbox = QCheckBox("低功耗模式（关闭背景动画）")
+        self.low_power_checkbox.setChecked(os.environ.get(LOW_POWER_ENV) == "1")
+        self.low_power_checkbox.toggled.connect(self.update_animation_timer)
+        current_ratio_form.addRow(self.low_power_checkbox)
+        
+        # 输出缓存：相同内容的源图片和预设直接复用之前编码的输出
+        self.cache_size_spin = QSpinBox()
+        self.cache_size_spin.setRange(0, 1024 * 1024)
+        self.cache_size_spin.setValue(0)
+        self.cache_size_spin.setSpecialValueText("不使用")
+        self.cache_size_spin.setSuffix(" MB")
+        self.cache_size_spin.setMinimumHeight(40)
+        self.cache_size_spin.setToolTip(f"默认不使用输出缓存；建议上限 {DEFAULT_CACHE_SIZE // (1024 * 1024)} MB")
+        current_ratio_form.addRow("输出缓存上限:", self.cache_size_spin)
+        
+        self.recursive_checkbox = QCheckBox("包含子文件夹（输出保留目录结构）")
+        self.recursive_checkbox.setChecked(False)
+        self.recursive_checkbox.toggled.connect(self.refresh_browser)
+        current_ratio_form.addRow(self.recursive_checkbox)
+        
         # 参数设置区按钮布局 - 并排显示
         param_buttons_layout = QHBoxLayout()
         param_buttons_layout.setSpacing(10)
@@ -447,6 +741,29 @@ class ImageCompressor(QMainWindow):
         right_layout = QVBoxLayout(right_frame)
         right_layout.setSpacing(15)
         
+        # 图片浏览区域：选择文件夹后显示其中的图片，选中部分图片时只处理选中的图片
+        browser_title = QLabel("图片浏览")
+        browser_title.setProperty("class", "section-title")
+        right_layout.addWidget(browser_title)
+        
+        self.browser_group = QGroupBox()
+        self.browser_group.setObjectName("browserGroup")
+        self.browser_group.setTitle("")
+        browser_layout = QVBoxLayout()
+        
+        self.file_browser = FileBrowser()
+        self.file_browser.setMinimumHeight(300)
+        self.file_browser.count_changed.connect(self.update_browser_label)
+        self.file_browser.selectionModel().selectionChanged.connect(self.update_browser_label)
+        browser_layout.addWidget(self.file_browser)
+        
+        self.browser_label = QLabel("未选择文件夹")
+        self.browser_label.setStyleSheet("font-size: 10pt; color: #0d47a1;")
+        browser_layout.addWidget(self.browser_label)
+        
+        self.browser_group.setLayout(browser_layout)
+        right_layout.addWidget(self.browser_group)
+        
         # 处理队列区域
         queue_title = QLabel("处理队列")
         queue_title.setProperty("class", "section-title")
@@ -458,7 +775,7 @@ class ImageCompressor(QMainWindow):
         queue_layout = QVBoxLayout()
         
         self.queue_list = QListWidget()
-        self.queue_list.setMinimumHeight(500)
+        self.queue_list.setMinimumHeight(250)
         # 支持选择多个队列项
         self.queue_list.setSelectionMode(QListWidget.ExtendedSelection)
         queue_layout.addWidget(self.queue_list)
@@ -523,6 +840,15 @@ class ImageCompressor(QMainWindow):
         self.process_btn.clicked.connect(self.process_images)
         process_buttons_layout.addWidget(self.process_btn)
         
+        # 监视文件夹：新图片写入完成后自动按处理队列处理，再次点击停止
+        self.watch_btn = QPushButton("监视文件夹")
+        self.watch_btn.setIcon(QIcon.fromTheme("view-refresh"))
+        self.watch_btn.setMinimumHeight(110)
+        self.watch_btn.setCheckable(True)
+        self.watch_btn.setToolTip("持续监视图片文件夹，新增或修改的图片写入完成后几秒内自动处理")
+        self.watch_btn.clicked.connect(self.toggle_watch)
+        process_buttons_layout.addWidget(self.watch_btn)
+        
         self.output_folder_btn = QPushButton("设置输出文件夹")
         self.output_folder_btn.setIcon(QIcon.fromTheme("folder-open"))
         self.output_folder_btn.setMinimumHeight(110)
@@ -548,20 +874,53 @@ class ImageCompressor(QMainWindow):
             self.folder_path = folder
             self.folder_label.setText(f"目标文件夹: {folder}")
             self.statusBar().showMessage(f"已选择文件夹: {folder}")
+            self.refresh_browser()
 
-    def add_current_to_queue(self):
-        """将当前参数设置添加到处理队列"""
-        # 获取当前参数设置
-        current_settings = {
+    def refresh_browser(self):
+        """重新扫描图片浏览面板"""
+        if self.folder_path:
+            output_folder = getattr(self, 'output_folder', None)
+            self.file_browser.load_folder(self.folder_path, self.recursive_checkbox.isChecked(),
+                                          skip_dirs=[output_folder] if output_folder else [])
+
+    def update_browser_label(self, *args):
+        """更新图片浏览面板下方的图片数量和选中数量"""
+        total = len(self.file_browser.image_model.paths)
+        selected = len(self.file_browser.selectionModel().selectedIndexes())
+        text = f"共 {total} 张图片"
+        if selected:
+            text += f"，已选中 {selected} 张（只处理选中的图片）"
+        self.browser_label.setText(text)
+
+    def current_settings(self):
+        """获取当前参数设置"""
+        settings = {
             'width': self.width_spin.value(),
             'height': self.height_spin.value(),
             'quality': self.quality_spin.value(),
             'crop': self.crop_checkbox.isChecked()
         }
+        if self.max_kb_spin.value():
+            settings['max_kb'] = self.max_kb_spin.value()
+        # 编码器设置只保存与默认值不同的项
+        encoder = {
+            'format': self.format_combo.currentData(),
+            'progressive': self.progressive_checkbox.isChecked(),
+            'optimize': self.optimize_checkbox.isChecked(),
+            'subsampling': self.subsampling_combo.currentData(),
+            'method': self.method_spin.value(),
+            'animation': self.animation_checkbox.isChecked(),
+        }
+        settings.update((key, value) for key, value in encoder.items() if value != PRESET_DEFAULTS[key])
+        return settings
+
+    def add_current_to_queue(self):
+        """将当前参数设置添加到处理队列"""
+        # 获取当前参数设置
+        current_settings = self.current_settings()
         
         # 在队列列表中显示
-        item_text = f"宽: {current_settings['width']}, 高: {current_settings['height']}, 质量: {current_settings['quality']}, 裁剪: {'是' if current_settings['crop'] else '否'}"
-        self.queue_list.addItem(item_text)
+        self.queue_list.addItem(describe_preset(current_settings))
         
         # 存储实际设置以便处理时使用
         self.process_queue.append(current_settings)
@@ -615,12 +974,7 @@ class ImageCompressor(QMainWindow):
                     return
                     
             # 保存当前设置
-            self.size_presets[name] = {
-                'width': self.width_spin.value(),
-                'height': self.height_spin.value(),
-                'quality': self.quality_spin.value(),
-                'crop': self.crop_checkbox.isChecked()
-            }
+            self.size_presets[name] = self.current_settings()
             
             # 更新列表显示
             self.update_presets_list()
@@ -693,7 +1047,7 @@ class ImageCompressor(QMainWindow):
             preset = self.size_presets[str(item)]
             
             # 添加到队列
-            item_text = f"宽: {preset['width']}, 高: {preset['height']}, 质量: {preset['quality']}, 裁剪: {'是' if preset['crop'] else '否'} (预设: {item})"
+            item_text = f"{describe_preset(preset)} (预设: {item})"
             self.queue_list.addItem(item_text)
             self.process_queue.append(preset)
             
@@ -715,7 +1069,7 @@ class ImageCompressor(QMainWindow):
             imported_count = 0
             for name, preset in self.size_presets.items():
                 # 添加到队列
-                item_text = f"宽: {preset['width']}, 高: {preset['height']}, 质量: {preset['quality']}, 裁剪: {'是' if preset['crop'] else '否'} (预设: {name})"
+                item_text = f"{describe_preset(preset)} (预设: {name})"
                 self.queue_list.addItem(item_text)
                 self.process_queue.append(preset)
                 imported_count += 1
@@ -725,10 +1079,8 @@ class ImageCompressor(QMainWindow):
     def load_size_presets(self):
         """从文件加载尺寸预设"""
         try:
-            if os.path.exists(self.presets_file):
-                with open(self.presets_file, 'r', encoding='utf-8') as f:
-                    self.size_presets = json.load(f)
-                self.update_presets_list()
+            self.size_presets = load_presets(self.presets_file)
+            self.update_presets_list()
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载预设失败: {str(e)}")
             self.size_presets = {}
@@ -736,8 +1088,7 @@ class ImageCompressor(QMainWindow):
     def save_size_presets(self):
         """保存尺寸预设到文件"""
         try:
-            with open(self.presets_file, 'w', encoding='utf-8') as f:
-                json.dump(self.size_presets, f, ensure_ascii=False, indent=2)
+            save_presets(self.size_presets, self.presets_file)
         except Exception as e:
             QMessageBox.warning(self, "错误", f"保存预设失败: {str(e)}")
 
@@ -772,6 +1123,7 @@ class ImageCompressor(QMainWindow):
         selected = self.presets_list.currentItem()
         if not selected:
             return
+        self.load_output_formats()
             
         name = selected.text()
         if name in self.size_presets:
@@ -780,6 +1132,17 @@ class ImageCompressor(QMainWindow):
             self.height_spin.setValue(preset['height'])
             self.quality_spin.setValue(preset['quality'])
             self.crop_checkbox.setChecked(preset['crop'])
+            self.max_kb_spin.setValue(preset_option(preset, 'max_kb'))
+            # 当前 Pillow 不支持的格式找不到对应项时保持原选择
+            format_index = self.format_combo.findData(preset_option(preset, 'format'))
+            if format_index >= 0:
+                self.format_combo.setCurrentIndex(format_index)
+            self.subsampling_combo.setCurrentIndex(
+                max(0, self.subsampling_combo.findData(preset_option(preset, 'subsampling'))))
+            self.progressive_checkbox.setChecked(preset_option(preset, 'progressive'))
+            self.optimize_checkbox.setChecked(preset_option(preset, 'optimize'))
+            self.method_spin.setValue(preset_option(preset, 'method'))
+            self.animation_checkbox.setChecked(preset_option(preset, 'animation'))
             self.statusBar().showMessage(f"已加载预设: {name}")
 
     def rename_preset(self):
@@ -808,28 +1171,18 @@ class ImageCompressor(QMainWindow):
         if folder:
             self.output_folder = folder
             self.statusBar().showMessage(f"已设置输出文件夹: {folder}")
+            if self.recursive_checkbox.isChecked():
+                self.refresh_browser()
 
-    def process_images(self):
-        """处理队列中的预设配置"""
+    def prepare_run(self):
+        """检查设置并创建输出文件夹，返回输出文件夹；无法开始处理时返回 None"""
         if not self.folder_path:
             QMessageBox.warning(self, "警告", "请先选择图片文件夹")
-            return
+            return None
             
         if len(self.process_queue) == 0:
             QMessageBox.warning(self, "警告", "处理队列为空，请先添加配置到队列")
-            return
-            
-        # 获取所有图片文件
-        image_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff')
-        image_files = [
-            os.path.join(self.folder_path, f) 
-            for f in os.listdir(self.folder_path) 
-            if f.lower().endswith(image_extensions)
-        ]
-        
-        if not image_files:
-            QMessageBox.warning(self, "警告", "所选文件夹中没有图片文件")
-            return
+            return None
             
         # 如果未设置输出文件夹，使用源文件夹
         output_folder = getattr(self, 'output_folder', None) or self.folder_path
@@ -840,94 +1193,170 @@ class ImageCompressor(QMainWindow):
                 os.makedirs(output_folder)
             except Exception as e:
                 QMessageBox.critical(self, "错误", f"无法创建输出文件夹: {str(e)}")
-                return
-                
-        # 创建进度对话框
-        total_items = len(image_files) * len(self.process_queue)
-        progress = QProgressDialog("正在处理图片...", "取消", 0, total_items, self)
-        progress.setWindowTitle("处理中")
-        progress.setWindowModality(Qt.WindowModal)
-        progress.setValue(0)
-        
-        # 处理每张图片和每个预设配置
-        success_count = 0
-        error_files = []
-        current_progress = 0
-        
-        for preset_idx, preset in enumerate(self.process_queue):
-            target_width = preset['width']
-            target_height = preset['height']
-            quality = preset['quality']
-            crop = preset['crop']
-            
-            # 为每个预设创建子文件夹
-            preset_folder = os.path.join(output_folder, f"preset_{preset_idx + 1}_w{target_width}_h{target_height}")
-            if not os.path.exists(preset_folder):
-                os.makedirs(preset_folder)
+                return None
                 
-            for file_path in image_files:
-                if progress.wasCanceled():
-                    break
-                    
-                progress.setLabelText(f"正在处理: {os.path.basename(file_path)} (预设 {preset_idx + 1}/{len(self.process_queue)})")
-                
-                try:
-                    # 打开图片
-                    with Image.open(file_path) as img:
-                        # 计算调整后的尺寸
-                        original_width, original_height = img.size
-                        
-                        # 计算缩放比例
-                        width_ratio = target_width / original_width
-                        height_ratio = target_height / original_height
-                        ratio = min(width_ratio, height_ratio)
-                        
-                        # 缩放图片
-                        new_width = int(original_width * ratio)
-                        new_height = int(original_height * ratio)
-                        resized_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                        
-                        # 如果需要裁剪
-                        if crop and (new_width != target_width or new_height != target_height):
-                            left = (new_width - target_width) // 2
-                            top = (new_height - target_height) // 2
-                            right = left + target_width
-                            bottom = top + target_height
-                            resized_img = resized_img.crop((left, top, right, bottom))
-                        
-                        # 构建输出文件路径
-                        file_name = os.path.basename(file_path)
-                        output_file = os.path.join(preset_folder, file_name)
-                        
-                        # 保存图片
-                        if file_name.lower().endswith(('.jpg', '.jpeg')):
-                            resized_img.save(output_file, 'JPEG', quality=quality)
-                        elif file_name.lower().endswith('.png'):
-                            # PNG质量处理方式不同，使用优化参数
-                            resized_img.save(output_file, 'PNG', optimize=True)
-                        else:
-                            # 其他格式使用默认参数
-                            resized_img.save(output_file)
-                            
-                        success_count += 1
-                        
-                except Exception as e:
-                    error_files.append(f"{os.path.basename(file_path)} (预设 {preset_idx + 1}): {str(e)}")
-                    
-                current_progress += 1
-                progress.setValue(current_progress)
-                QApplication.processEvents()  # 更新UI
+        # 为每个预设创建子文件夹
+        try:
+            prepare_output_folders(output_folder, self.process_queue)
+        except Exception as e:
+            QMessageBox.critical(self, "错误", f"无法创建输出文件夹: {str(e)}")
+            return None
+        
+        self.run_success_count = 0
+        self.run_skipped_count = 0
+        self.run_error_files = []
+        self.run_report = RunReport(self.process_queue)
+        self.process_btn.setEnabled(False)
+        self.batch_running = True
+        self.update_animation_timer()
+        self.engine.set_worker_count(self.workers_spin.value())
+        memory_budget_mb = self.memory_budget_spin.value()
+        self.engine.pool.memory_budget = (memory_budget_mb * 1024 * 1024 if memory_budget_mb
+                                          else default_memory_budget())
+        return output_folder
+
+    def current_cache(self):
+        """按设置创建输出缓存，容量为 0 时不使用缓存"""
+        cache_size_mb = self.cache_size_spin.value()
+        return OutputCache(DEFAULT_CACHE_DIR, cache_size_mb * 1024 * 1024) if cache_size_mb else None
+
+    def process_images(self):
+        """处理队列中的预设配置"""
+        output_folder = self.prepare_run()
+        if output_folder is None:
+            return
+        self.watch_btn.setEnabled(False)
                 
-            if progress.wasCanceled():
-                break
+        # 边扫描边处理图片文件（递归时在输出中保留子文件夹结构）
+        recursive = self.recursive_checkbox.isChecked()
+        selected_files = self.file_browser.selected_paths()
+        if selected_files:
+            image_files = selected_files
+        else:
+            image_files = scan_images(self.folder_path, recursive=recursive, skip_dirs=[output_folder])
+        
+        # 创建进度对话框（扫描完成前总数未知，显示为忙碌状态）
+        self.progress_dialog = QProgressDialog("正在扫描并处理图片...", "取消", 0, 0, self)
+        self.progress_dialog.setWindowTitle("处理中")
+        self.progress_dialog.setWindowModality(Qt.WindowModal)
+        self.progress_dialog.setAutoClose(False)
+        self.progress_dialog.setAutoReset(False)
+        self.progress_dialog.canceled.connect(self.engine.cancel)
+        self.progress_dialog.setValue(0)
+        
+        # 交给后台引擎处理，每张图片只解码一次并生成所有预设的输出
+        self.engine.start_run(image_files, self.process_queue, output_folder,
+                              incremental=self.incremental_checkbox.isChecked(),
+                              source_root=self.folder_path if recursive else None,
+                              dedup=self.dedup_checkbox.isChecked(),
+                              cache=self.current_cache())
+        self.statusBar().showMessage(f"正在使用 {self.engine.max_workers} 个进程处理...")
+
+    def toggle_watch(self, checked):
+        """开始或停止监视图片文件夹"""
+        if not checked:
+            self.watch_btn.setEnabled(False)
+            self.statusBar().showMessage("正在停止监视...")
+            self.engine.cancel()
+            return
+        output_folder = self.prepare_run()
+        if output_folder is None:
+            self.watch_btn.setChecked(False)
+            return
+        # 监视期间不弹出进度对话框，处理进度显示在状态栏中
+        self.watch_btn.setText("停止监视")
+        self.engine.start_watch(self.folder_path, self.process_queue, output_folder,
+                                recursive=self.recursive_checkbox.isChecked(),
+                                incremental=self.incremental_checkbox.isChecked(),
+                                dedup=self.dedup_checkbox.isChecked(),
+                                cache=self.current_cache())
+        self.statusBar().showMessage(f"正在监视 {self.folder_path}，新图片写入完成后自动处理...")
+
+    def on_results_ready(self, results):
+        """记录一批 (文件, 预设) 的处理结果"""
+        for result in results:
+            self.run_report.add(result)
+            if result.skipped:
+                self.run_skipped_count += 1
+            elif result.error is None:
+                self.run_success_count += 1
+            else:
+                file_name = os.path.basename(result.source)
+                self.run_error_files.append(f"{file_name} (预设 {result.preset_index + 1}): {result.error}")
+
+    def on_processing_progress(self, done_count, total, file_name, rate):
+        """更新进度对话框"""
+        if self.progress_dialog is not None and not self.progress_dialog.wasCanceled():
+            if total:
+                self.progress_dialog.setMaximum(total)
+                self.progress_dialog.setLabelText(f"已处理: {file_name} ({done_count}/{total})")
+                self.progress_dialog.setValue(done_count)
+            else:
+                self.progress_dialog.setLabelText(f"已处理: {file_name} ({done_count}，仍在扫描文件夹)")
+        
+        if self.engine.watch_folder is not None:
+            # 监视时大部分时间在等待新图片，平均速度和剩余时间没有意义
+            self.statusBar().showMessage(f"正在监视: 已处理 {done_count} 项, 最近: {file_name}")
+            return
+        
+        # 状态栏显示实时速度、平均速度和预计剩余时间
+        speed_msg = (f"当前: {rate:.1f} 项/秒, 平均: {self.run_report.images_per_second():.1f} 张/秒, "
+                     f"{self.run_report.megabytes_per_second():.1f} MB/秒")
+        eta = self.run_report.eta(total)
+        if eta is not None:
+            minutes, seconds = divmod(int(eta), 60)
+            speed_msg += f", 预计剩余: {minutes}分{seconds:02d}秒"
+        self.statusBar().showMessage(f"已处理 {done_count} 项, {speed_msg}")
+
+    def on_processing_finished(self, cancelled):
+        """处理结束后显示结果"""
+        if self.progress_dialog is not None:
+            self.progress_dialog.close()
+            self.progress_dialog = None
+        self.process_btn.setEnabled(True)
+        self.watch_btn.setEnabled(True)
+        self.watch_btn.setChecked(False)
+        self.watch_btn.setText("监视文件夹")
+        self.batch_running = False
+        self.update_animation_timer()
+        watching = self.engine.watch_folder is not None
+        
+        if self.engine.run_error is not None:
+            QMessageBox.critical(self, "错误", f"处理中止: {self.engine.run_error}")
+        elif self.engine.found_count == 0 and not watching:
+            QMessageBox.warning(self, "警告", "所选文件夹中没有图片文件")
+            self.statusBar().showMessage("就绪")
+            return
+        
+        # 导出处理报告（各阶段耗时、压缩率、延迟百分位数）
+        self.run_report.finish()
+        report_base = os.path.join(self.engine.output_folder, REPORT_NAME)
+        try:
+            self.run_report.write_json(report_base + ".json")
+            self.run_report.write_csv(report_base + ".csv")
+            report_msg = f"\n处理报告: {report_base}.json / .csv"
+        except Exception as e:
+            report_msg = f"\n保存处理报告失败: {str(e)}"
         
         # 处理结果
-        result_msg = f"处理完成！成功: {success_count} 个, 失败: {len(error_files)} 个"
-        if error_files:
-            result_msg += "\n失败文件:\n" + "\n".join(error_files)
+        result_msg = f"处理完成！成功: {self.run_success_count} 个, 失败: {len(self.run_error_files)} 个"
+        if self.run_skipped_count:
+            result_msg += f", 未变化跳过: {self.run_skipped_count} 个"
+        if self.run_report.cached_count:
+            result_msg += f", 缓存命中: {self.run_report.cached_count} 个"
+        if not watching:
+            result_msg += f", 速度: {self.run_report.images_per_second():.1f} 张/秒"
+        if watching:
+            result_msg = "已停止监视。" + result_msg
+        elif cancelled:
+            result_msg = "处理已取消。" + result_msg
+        status_msg = result_msg
+        result_msg += report_msg
+        if self.run_error_files:
+            result_msg += "\n失败文件:\n" + "\n".join(self.run_error_files)
             
         QMessageBox.information(self, "处理结果", result_msg)
-        self.statusBar().showMessage(result_msg)
+        self.statusBar().showMessage(status_msg)
 
     def show_settings(self):
         """显示设置对话框"""
@@ -961,6 +1390,7 @@ class ImageCompressor(QMainWindow):
             6. 在"处理队列"区域可管理处理配置
             7. 设置输出文件夹（可选）
             8. 点击"开始处理图片"按钮开始处理
+            9. 点击"监视文件夹"后，新放入文件夹的图片写入完成后会自动处理，再次点击停止
 
             提示:
             - 双击预设可快速加载
@@ -968,10 +1398,74 @@ class ImageCompressor(QMainWindow):
             - 处理过程中可随时取消"""
         QMessageBox.information(self, "使用帮助", help_msg)
 
+    def load_output_formats(self):
+        """把当前 Pillow 支持的输出格式加入格式下拉框（只在第一次调用时加载）"""
+        if self.output_formats_loaded:
+            return
+        self.output_formats_loaded = True
+        for image_format in available_output_formats():
+            self.format_combo.addItem(image_format, image_format)
+
+    def finish_startup(self):
+        """窗口首次绘制后完成启动：加载 Pillow 和编码插件，确定可用的输出格式"""
+        self.load_output_formats()
+        if self.startup_times is not None:
+            self.startup_times['deferred'] = time.perf_counter()
+            self.report_startup_time()
+
+    def report_startup_time(self):
+        """打印启动各阶段耗时（--startup-time 模式）后退出"""
+        times = self.startup_times
+        print(f"导入模块: {(times['imported'] - STARTUP_BEGIN) * 1000:.0f} ms")
+        print(f"创建窗口: {(times['built'] - times['imported']) * 1000:.0f} ms")
+        print(f"首次绘制: {(times['painted'] - STARTUP_BEGIN) * 1000:.0f} ms")
+        print(f"延迟加载完成: {(times['deferred'] - STARTUP_BEGIN) * 1000:.0f} ms")
+        QApplication.instance().quit()
+
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.first_painted:
+            # 本轮绘制（包括子部件）结束后再完成启动，不推迟窗口显示
+            self.first_painted = True
+            if self.startup_times is not None:
+                self.startup_times['painted'] = time.perf_counter()
+            QTimer.singleShot(0, self.finish_startup)
+
     def update_animation(self):
         """更新背景动画"""
         self.animation_frame = (self.animation_frame + 1) % 100
 
+    def update_animation_timer(self, *args):
+        """只在窗口可见、空闲且未启用低功耗模式时运行动画定时器"""
+        active = (self.isVisible() and not self.isMinimized() and not self.batch_running
+                  and not self.low_power_checkbox.isChecked())
+        if active and not self.animation_timer.isActive():
+            self.animation_timer.start()
+        elif not active and self.animation_timer.isActive():
+            self.animation_timer.stop()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.update_animation_timer()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.update_animation_timer()
+
+    def changeEvent(self, event):
+        """最小化或恢复窗口时暂停或恢复动画"""
+        super().changeEvent(event)
+        if event.type() == QEvent.WindowStateChange:
+            self.update_animation_timer()
+
+    def closeEvent(self, event):
+        """关闭窗口时停止处理并关闭进程池"""
+        self.engine.cancel()
+        self.engine.wait()
+        self.engine.shutdown()
+        self.file_browser.shutdown()
+        super().closeEvent(event)
+
     def resizeEvent(self, event):
         """窗口大小改变时调整背景"""
         if hasattr(self, 'decorative_bg'):
@@ -979,11 +1473,13 @@ class ImageCompressor(QMainWindow):
         super().resizeEvent(event)
 
 if __name__ == "__main__":
+    # 打包为可执行文件时，子进程需要此调用
+    multiprocessing.freeze_support()
+    startup_times = {'imported': time.perf_counter()} if STARTUP_TIME_ARG in sys.argv else None
     app = QApplication(sys.argv)
     # 确保中文显示正常
-    font = QFont("Microsoft YaHei UI")
-    app.setFont(font)
-    compressor = ImageCompressor()
+    app.setFont(ui_font())
+    compressor = ImageCompressor(startup_times)
     compressor.show()
     sys.exit(app.exec_())
     
\ No newline at end of file
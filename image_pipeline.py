@@ -0,0 +1,2381 @@
+"""图片批量压缩的核心处理流程（不依赖 Qt）
+
+可以作为库导入：
+
+    from image_pipeline import compress, load_presets
+
+    presets = list(load_presets().values())
+    for result in compress(["a.jpg", "b.png"], presets, "out"):
+        print(result.output, result.error)
+
+图形界面 image_compressor.py 和命令行 compress_cli.py 都基于本模块。
+"""
+import io
+import os
+import csv
+import json
+import math
+import time
+import shutil
+import fnmatch
+import hashlib
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+# Pillow（及其编码插件）和 NumPy 导入较慢，第一次需要时才导入（见 load_pillow 和 _load_numpy），
+# 图形界面可以先显示窗口，只使用命令行参数或处理记录的代码也不必等待
+Image = ImageMode = ImageSequence = None
+np = None
+_numpy_checked = False
+
+# 预设文件路径（图形界面保存的尺寸预设）
+DEFAULT_PRESETS_FILE = os.path.join(os.path.expanduser("~"), ".image_compressor_presets.json")
+# 每个预设输出子文件夹中的处理记录文件名
+MANIFEST_NAME = ".image_compressor_manifest.json"
+# 处理过程中逐条追加完成记录的日志，处理中断后据此续传，保存处理记录后删除
+JOURNAL_NAME = ".image_compressor_journal.jsonl"
+# 日志同步到磁盘的最短间隔（秒）
+JOURNAL_SYNC_INTERVAL = 1.0
+# 输出缓存的默认位置和容量上限（字节）
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".image_compressor_cache")
+DEFAULT_CACHE_SIZE = 2 * 1024 * 1024 * 1024
+# 输出缓存格式版本，编码结果不再兼容时递增，旧的缓存会被当作未命中并逐渐淘汰
+CACHE_VERSION = 1
+# 预设输出子文件夹名称的匹配模式，递归扫描时跳过这些文件夹
+PRESET_FOLDER_PATTERN = "preset_*_w*_h*"
+
+# 支持的图片扩展名
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.tiff', '.webp')
+# 缩放级联：中间结果至少为目标尺寸的多少倍时，才用它代替原图作为缩放源（保证画质）
+CASCADE_MIN_FACTOR = 2.0
+# 解码时缩小：缩小后的图片至少保留为最大输出尺寸的多少倍（与 Pillow thumbnail 的 reducing_gap 含义相同）
+SHRINK_ON_LOAD_GAP = 2.0
+# 预设可选参数的默认值（旧版本保存的预设中没有这些参数）
+PRESET_DEFAULTS = {
+    # 输出文件大小上限 (KB)，0 表示不限制
+    'max_kb': 0,
+    # 输出格式（OUTPUT_FORMATS 中的键），空字符串表示与源文件相同
+    'format': '',
+    # JPEG：渐进式编码
+    'progressive': False,
+    # JPEG：优化霍夫曼编码表（无损，文件略小，编码略慢）
+    'optimize': False,
+    # JPEG：色度子采样（'4:4:4'、'4:2:2'、'4:2:0'），空字符串表示使用编码器默认值
+    'subsampling': '',
+    # WebP/AVIF：编码耗时（0-6，越大越慢、文件越小）
+    'method': 4,
+    # 动图（GIF、APNG、动态 WebP）逐帧缩放并保留动画，关闭或输出格式不支持动画时只保留第一帧
+    'animation': True,
+}
+# 预设可以选择的输出格式及其扩展名
+OUTPUT_FORMATS = {
+    'JPEG': '.jpg',
+    'PNG': '.png',
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+}
+# 可以保存动画的输出格式
+ANIMATED_FORMATS = ('GIF', 'PNG', 'WEBP', 'AVIF')
+# JPEG 色度子采样选项
+SUBSAMPLING_OPTIONS = ('4:4:4', '4:2:2', '4:2:0')
+# 按文件大小上限搜索压缩质量时允许的最低质量
+MIN_QUALITY = 10
+# 支持按质量调整文件大小的保存格式
+QUALITY_FORMATS = ('JPEG', 'WEBP', 'AVIF')
+# 感知哈希（dHash）的边长，哈希共 DEDUP_HASH_SIZE * DEDUP_HASH_SIZE 位
+DEDUP_HASH_SIZE = 16
+# 尺寸相同且感知哈希最多相差多少位时视为重复图片的候选
+DEDUP_MAX_DISTANCE = 8
+# 确认候选时比较的彩色缩略图边长
+DEDUP_PROXY_SIZE = 64
+# 候选与代表图片的缩略图每个像素各通道最多相差多少才视为重复（重新压缩的副本通常只相差几级）
+DEDUP_MAX_PIXEL_DIFF = 24
+# 处理记录锁文件超过多少秒未释放时视为持有者已崩溃（见 OutputManifest.save）
+MANIFEST_LOCK_STALE = 60.0
+# 监视文件夹时两次扫描之间的间隔（秒）
+WATCH_INTERVAL = 2.0
+# 文件大小和修改时间保持不变这么久（秒）才视为已写入完成
+WATCH_SETTLE = 3.0
+# 监视文件夹时保存处理记录并清理源文件已删除的输出的间隔（秒）
+WATCH_SAVE_INTERVAL = 600.0
+# 任务文件格式版本
+JOB_SPEC_VERSION = 1
+# 预设必须包含的参数
+PRESET_REQUIRED_KEYS = ('width', 'height', 'quality', 'crop')
+# 可以用 reduce() 按像素平均缩小的图片模式（调色板等模式不能平均）
+REDUCIBLE_MODES = ('L', 'LA', 'RGB', 'RGBA', 'RGBX', 'CMYK', 'YCbCr', 'I', 'F')
+# 多进程处理且有空闲进程时，像素数不少于此值、需要生成两个以上预设的图片把各预设的编码分给其他进程（见 SharedImage）
+SPLIT_ENCODE_MIN_PIXELS = 12_000_000
+# 可以放入共享内存交给其他进程编码的图片模式，其余模式在解码的进程中编码
+SHAREABLE_MODES = ('L', 'RGB', 'RGBA', 'CMYK')
+# 预读窗口：提前读入内存、等待处理的源文件总字节数上限（超过此大小的单个文件由处理进程自己读取）
+READ_AHEAD_BYTES = 64 * 1024 * 1024
+# 预读源文件的线程数（同时发出多个读取请求，掩盖网络存储的延迟）
+READ_AHEAD_THREADS = 4
+# 每个进程中把编码好的输出写入磁盘的线程数（写入与后续预设的编码同时进行）
+WRITE_BEHIND_THREADS = 4
+# 编码较慢、值得交给其他进程的输出格式（JPEG 编码比复制到共享内存还快，除非需要搜索质量）
+SLOW_ENCODE_FORMATS = ('PNG', 'WEBP', 'AVIF')
+
+
+def load_pillow():
+    """导入 Pillow 并返回 PIL.Image 模块，只有第一次调用时真正导入
+
+    模块中用到 Pillow 的函数都会先调用它；需要提前加载时（如在后台预热）也可以直接调用。
+    """
+    global Image, ImageMode, ImageSequence
+    if ImageSequence is None:
+        from PIL import Image, ImageMode, ImageSequence
+    return Image
+
+
+def _load_numpy():
+    """第一次需要时导入 NumPy，没有安装时返回 None（使用纯 Python 计算感知哈希）"""
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy as np
+        except ImportError:
+            np = None
+        _numpy_checked = True
+    return np
+
+
+def preset_option(preset, key):
+    """读取预设的可选参数，缺省时使用 PRESET_DEFAULTS 中的默认值"""
+    return preset.get(key, PRESET_DEFAULTS[key])
+
+
+def describe_preset(preset):
+    """生成预设的简要说明文字"""
+    text = (f"宽: {preset['width']}, 高: {preset['height']}, 质量: {preset['quality']}, "
+            f"裁剪: {'是' if preset['crop'] else '否'}")
+    if preset_option(preset, 'max_kb'):
+        text += f", 上限: {preset_option(preset, 'max_kb')}KB"
+    if preset_option(preset, 'format'):
+        text += f", 格式: {preset_option(preset, 'format')}"
+    return text
+
+
+def available_output_formats():
+    """返回当前 Pillow 可以保存的输出格式（AVIF 等格式需要 Pillow 编译时启用）"""
+    load_pillow()
+    Image.init()
+    return [image_format for image_format in OUTPUT_FORMATS if image_format in Image.SAVE]
+
+
+def preset_folder_name(preset_idx, preset):
+    """生成预设对应的输出子文件夹名称"""
+    return f"preset_{preset_idx + 1}_w{preset['width']}_h{preset['height']}"
+
+
+def compute_resize_size(original_size, preset):
+    """按预设计算保持比例缩放后的尺寸"""
+    original_width, original_height = original_size
+    width_ratio = preset['width'] / original_width
+    height_ratio = preset['height'] / original_height
+    ratio = min(width_ratio, height_ratio)
+    return int(original_width * ratio), int(original_height * ratio)
+
+
+def fit_geometry(original_size, preset):
+    """计算预设的输出尺寸、缩放比例和需要的源图区域
+
+    启用裁剪且比例不匹配时使用填充模式（cover）：按较大的缩放比例铺满目标尺寸，
+    在原图坐标中计算居中的裁剪区域，缩放时只对这部分像素重采样，输出尺寸与目标完全一致。
+    否则按较小的缩放比例完整保留画面。返回 (输出尺寸, 缩放比例, 原图坐标中的区域或 None)。
+    """
+    original_width, original_height = original_size
+    target_width, target_height = preset['width'], preset['height']
+    width_ratio = target_width / original_width
+    height_ratio = target_height / original_height
+    new_size = compute_resize_size(original_size, preset)
+    if not preset['crop'] or new_size == (target_width, target_height):
+        return new_size, min(width_ratio, height_ratio), None
+
+    scale = max(width_ratio, height_ratio)
+    box_width = target_width / scale
+    box_height = target_height / scale
+    left = (original_width - box_width) / 2
+    top = (original_height - box_height) / 2
+    return (target_width, target_height), scale, (left, top, left + box_width, top + box_height)
+
+
+def shrink_on_load(img, presets):
+    """解码源图片，并在完整缩放前先低成本地缩小，返回缩小后的图片
+
+    JPEG 通过 draft() 让解码器利用 DCT 缩放直接解码出较小的图片；其他格式解码后先做整数倍
+    reduce()。缩小后的尺寸至少保留为所有预设中最大输出尺寸的 SHRINK_ON_LOAD_GAP 倍。
+    """
+    original_width, original_height = img.size
+    scale = max(fit_geometry(img.size, preset)[1] for preset in presets) * SHRINK_ON_LOAD_GAP
+    if scale >= 1:
+        img.load()
+        return img
+
+    min_width = math.ceil(original_width * scale)
+    min_height = math.ceil(original_height * scale)
+    if img.format == 'JPEG':
+        img.draft(img.mode, (min_width, min_height))
+    img.load()
+
+    factor = min(img.width // min_width, img.height // min_height)
+    if factor > 1 and img.mode in REDUCIBLE_MODES:
+        return img.reduce(factor)
+    return img
+
+
+def estimate_job_memory(file_path, presets, only=None, data=None):
+    """只读取文件头（不解码像素）估算处理一个源文件需要的内存字节数
+
+    包括解码后的源图（JPEG 按 draft() 缩小后的尺寸）、reduce() 的结果和各预设的输出图片，
+    以及已读入内存的源文件内容 data。无法读取时返回 0，由处理流程报告错误。
+    """
+    load_pillow()
+    indices = range(len(presets)) if only is None else only
+    try:
+        with open_source(file_path, data) as img:
+            original_width, original_height = img.size
+            mode, image_format = img.mode, img.format
+            # 动图逐帧解码，但缩放后的帧全部交给编码器（GIF 需要扫描整个文件才能知道帧数）
+            frame_count = img.n_frames if getattr(img, 'is_animated', False) else 1
+    except Exception:
+        return 0
+    try:
+        mode_info = ImageMode.getmode(mode)
+        bytes_per_pixel = max(len(mode_info.bands) * int(mode_info.typestr[-1]), 1)
+    except (KeyError, ValueError):
+        bytes_per_pixel = 4
+    if mode in ('RGB', 'YCbCr'):
+        # Pillow 内部以每像素 4 字节存储三通道图片
+        bytes_per_pixel = 4
+
+    geometry = [fit_geometry((original_width, original_height), presets[i]) for i in indices]
+    decoded_pixels = original_width * original_height
+    scale = max((scale for _, scale, _ in geometry), default=1) * SHRINK_ON_LOAD_GAP
+    if scale < 1 and image_format == 'JPEG':
+        # draft() 最多缩小到 1/8，且保证不小于需要的尺寸
+        draft_factor = 1
+        while draft_factor < 8 and draft_factor * 2 * scale <= 1:
+            draft_factor *= 2
+        decoded_pixels //= draft_factor * draft_factor
+    reduced_pixels = decoded_pixels * min(scale, 1) ** 2 if scale < 1 else 0
+    output_pixels = sum(width * height for (width, height), _, _ in geometry) * frame_count
+    return int((decoded_pixels + reduced_pixels + output_pixels) * bytes_per_pixel) + len(data or b'')
+
+
+def default_memory_budget():
+    """默认内存预算：物理内存的一半；无法获取物理内存时返回 None（不限制）"""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+class StageTimer:
+    """记录单个源文件各处理阶段的耗时
+
+    文件级阶段（open、decode）记在 file_timings 中，预设级阶段（resize、encode、write）
+    按预设序号记在 preset_timings 中。hooks 为可调用对象列表，每个阶段结束时以
+    (阶段名称, 耗时秒数, 文件路径, 预设序号或None) 调用；多进程处理时在工作进程中调用，需要能被 pickle；
+    write 阶段在输出写入线程中调用。
+    """
+
+    def __init__(self, file_path=None, hooks=()):
+        self.file_path = file_path
+        self.hooks = hooks or ()
+        self.file_timings = {}
+        self.preset_timings = {}
+
+    @contextmanager
+    def stage(self, name, preset_idx=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            timings = self.file_timings if preset_idx is None else self.preset_timings.setdefault(preset_idx, {})
+            timings[name] = timings.get(name, 0.0) + elapsed
+            for hook in self.hooks:
+                hook(name, elapsed, self.file_path, preset_idx)
+
+    def timings_for(self, preset_idx):
+        """返回某个预设的各阶段耗时（包含共享的文件级阶段）"""
+        timings = dict(self.file_timings)
+        timings.update(self.preset_timings.get(preset_idx, {}))
+        return timings
+
+
+def render_presets(img, presets, original_size=None, only=None, timer=None):
+    """基于同一张已解码的图片生成所有预设的输出
+
+    按输出尺寸从大到小处理，较小的输出优先从已生成的较大中间结果继续缩放（缩放级联），
+    参数相同的预设直接复用缩放结果。需要裁剪的预设在源图坐标中计算裁剪区域，一次缩放完成（见 fit_geometry）。
+    img 经过解码时缩小的，需要传入原图尺寸 original_size，输出尺寸始终按原图尺寸计算。
+    only 为需要生成的预设序号，默认全部。timer 为 StageTimer 时记录缩放耗时。
+    逐个产出 (预设序号, 图片, 错误信息)。
+    """
+    load_pillow()
+    timer = timer or StageTimer()
+    original_size = original_size or img.size
+    geometry = [fit_geometry(original_size, preset) for preset in presets]
+    indices = range(len(presets)) if only is None else only
+    order = sorted(indices, key=lambda i: geometry[i][0][0] * geometry[i][0][1], reverse=True)
+    # 可作为缩放源的完整画面图片（未裁剪），第一个始终是原图
+    bases = [img]
+    rendered = {}
+
+    for preset_idx in order:
+        new_size, _, box = geometry[preset_idx]
+        try:
+            resized_img = rendered.get((new_size, box))
+            if resized_img is None:
+                # 需要的区域（原图坐标），完整画面时为整张图
+                region = box or (0, 0, original_size[0], original_size[1])
+                region_width = region[2] - region[0]
+                region_height = region[3] - region[1]
+                # 选择满足画质要求的最小中间结果，找不到时使用原图
+                base = img
+                for candidate in reversed(bases[1:]):
+                    if (region_width * candidate.width / original_size[0] >= new_size[0] * CASCADE_MIN_FACTOR
+                            and region_height * candidate.height / original_size[1]
+                            >= new_size[1] * CASCADE_MIN_FACTOR):
+                        base = candidate
+                        break
+                # 把区域换算到缩放源的坐标
+                base_box = None
+                if box is not None:
+                    x_scale = base.width / original_size[0]
+                    y_scale = base.height / original_size[1]
+                    base_box = (box[0] * x_scale, box[1] * y_scale, box[2] * x_scale, box[3] * y_scale)
+                with timer.stage('resize', preset_idx):
+                    resized_img = base.resize(new_size, Image.Resampling.LANCZOS, box=base_box)
+                rendered[(new_size, box)] = resized_img
+                if box is None:
+                    bases.append(resized_img)
+            yield preset_idx, resized_img, None
+        except Exception as e:
+            yield preset_idx, None, str(e)
+
+
+def encoder_settings(output_file, quality, preset=None):
+    """按输出文件扩展名返回 (保存格式, 保存参数)，给出 preset 时加入预设的编码器设置"""
+    load_pillow()
+    file_name = os.path.basename(output_file).lower()
+    if file_name.endswith(('.jpg', '.jpeg')):
+        params = {'quality': quality}
+        if preset is not None:
+            if preset_option(preset, 'progressive'):
+                params['progressive'] = True
+            if preset_option(preset, 'optimize'):
+                params['optimize'] = True
+            if preset_option(preset, 'subsampling'):
+                params['subsampling'] = preset_option(preset, 'subsampling')
+        return 'JPEG', params
+    if file_name.endswith('.png'):
+        # PNG质量处理方式不同，使用优化参数
+        return 'PNG', {'optimize': True}
+    method = PRESET_DEFAULTS['method'] if preset is None else preset_option(preset, 'method')
+    if file_name.endswith('.webp'):
+        return 'WEBP', {'quality': quality, 'method': method}
+    if file_name.endswith('.avif'):
+        # AVIF 的 speed 与 method 方向相反（0 最慢），默认 method 4 对应编码器默认的 speed 6
+        return 'AVIF', {'quality': quality, 'speed': 10 - method}
+    # 其他格式使用默认参数
+    return Image.registered_extensions().get(os.path.splitext(file_name)[1]), {}
+
+
+def convert_for_format(image, image_format):
+    """把图片转换为保存格式支持的模式（透明图片保存为 JPEG 时以白色为背景）"""
+    load_pillow()
+    if image_format == 'JPEG':
+        if image.mode in ('L', 'RGB', 'RGBX', 'CMYK'):
+            return image
+        if image.has_transparency_data:
+            rgba = image.convert('RGBA')
+            background = Image.new('RGB', rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            return background
+        return image.convert('RGB')
+    if image_format in ('PNG', 'WEBP', 'AVIF') and image.mode in ('CMYK', 'YCbCr', 'LAB', 'HSV'):
+        return image.convert('RGB')
+    if image.mode == 'RGBX' and image_format not in ('WEBP', 'AVIF'):
+        # 共享内存中的 RGB 图片（见 SharedImage），WebP 和 AVIF 编码器可以直接读取
+        return image.convert('RGB')
+    return image
+
+
+# 每个 (预设, 格式) 上一张图片搜索到的质量，作为下一张图片的起点（每个工作进程各自保存）
+_quality_hints = {}
+
+
+def encode_to_size(image, output_file, quality, max_bytes, hint_key=None, preset=None):
+    """在不超过 max_bytes 的前提下，以尽量高（不超过 quality）的质量编码到内存
+
+    从上一张图片的搜索结果开始尝试，通常只需编码一到两次；最低质量仍超过上限时返回最低质量的结果。
+    JPEG 使用 4:4:4 或 4:2:2 色度采样且最低质量仍超过上限时，改用 4:2:0 再搜索一次。
+    返回 (编码后的字节, 使用的质量)。
+    """
+    image_format, params = encoder_settings(output_file, quality, preset)
+    if image_format not in QUALITY_FORMATS:
+        return encode_image(image, output_file, quality, preset), quality
+
+    image = convert_for_format(image, image_format)
+    data, best, fitted = _search_quality(image, image_format, params, quality, max_bytes, hint_key)
+    if not fitted and image_format == 'JPEG' and params.get('subsampling', '4:2:0') != '4:2:0':
+        data, best, _ = _search_quality(image, image_format, dict(params, subsampling='4:2:0'),
+                                        quality, max_bytes, (hint_key, '4:2:0'))
+    return data, best
+
+
+def _search_quality(image, image_format, params, quality, max_bytes, hint_key):
+    """搜索不超过 max_bytes 的最高质量，返回 (编码后的字节, 质量, 是否满足上限)"""
+    encoded = {}
+
+    def fits(q):
+        if q not in encoded:
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, **dict(params, quality=q))
+            encoded[q] = buffer.getvalue()
+        return len(encoded[q]) <= max_bytes
+
+    low, high = MIN_QUALITY, quality
+    guess = min(max(_quality_hints.get(hint_key, high), low), high)
+    if fits(guess):
+        # 起点满足要求时向上确认是否还能提高质量
+        if guess == high or not fits(guess + 1):
+            best = guess
+        else:
+            best, low = guess + 1, guess + 2
+            while low <= high:
+                mid = (low + high) // 2
+                if fits(mid):
+                    best, low = mid, mid + 1
+                else:
+                    high = mid - 1
+    else:
+        best, high = None, guess - 1
+        while low <= high:
+            mid = (low + high) // 2
+            if fits(mid):
+                best, low = mid, mid + 1
+            else:
+                high = mid - 1
+        if best is None:
+            # 最低质量仍超过上限
+            fits(MIN_QUALITY)
+            _quality_hints[hint_key] = MIN_QUALITY
+            return encoded[MIN_QUALITY], MIN_QUALITY, False
+
+    _quality_hints[hint_key] = best
+    return encoded[best], best, True
+
+
+def encode_for_preset(image, output_file, preset):
+    """按预设参数编码输出图片，设置了文件大小上限时搜索合适的质量"""
+    max_kb = preset_option(preset, 'max_kb')
+    if not max_kb:
+        return encode_image(image, output_file, preset['quality'], preset)
+    hint_key = (preset_fingerprint(preset), os.path.splitext(output_file)[1].lower())
+    data, _ = encode_to_size(image, output_file, preset['quality'], max_kb * 1024, hint_key, preset)
+    return data
+
+
+def slow_encode(output_file, preset):
+    """输出的编码是否较慢：慢速格式，或设置了文件大小上限需要多次编码"""
+    if preset_option(preset, 'max_kb'):
+        return True
+    return encoder_settings(output_file, preset['quality'], preset)[0] in SLOW_ENCODE_FORMATS
+
+
+def save_image(image, output_file, quality, preset=None):
+    """按输出文件扩展名选择格式保存图片"""
+    image_format, params = encoder_settings(output_file, quality, preset)
+    convert_for_format(image, image_format).save(output_file, image_format, **params)
+
+
+def encode_image(image, output_file, quality, preset=None):
+    """按输出文件扩展名把图片编码到内存，返回编码后的字节"""
+    image_format, params = encoder_settings(output_file, quality, preset)
+    buffer = io.BytesIO()
+    convert_for_format(image, image_format).save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def keeps_animation(img, output_file, preset):
+    """判断是否按动图处理：源图片有多帧、预设保留动画且输出格式支持动画"""
+    return (getattr(img, 'is_animated', False) and preset_option(preset, 'animation')
+            and encoder_settings(output_file, preset['quality'])[0] in ANIMATED_FORMATS)
+
+
+def encode_animation(frames, durations, loop, output_file, preset):
+    """把缩放后的所有帧编码为动图，返回编码后的字节
+
+    loop 为源文件的循环次数，为 None 时源文件只播放一次。不按文件大小上限搜索质量。
+    """
+    image_format, params = encoder_settings(output_file, preset['quality'], preset)
+    params = dict(params, save_all=True, append_images=frames[1:], duration=durations)
+    if loop is not None:
+        params['loop'] = loop
+    elif image_format != 'GIF':
+        # GIF 不写循环次数时只播放一次，其他格式需要明确指定
+        params['loop'] = 1
+    if image_format == 'GIF' and frames[0].mode == 'RGBA':
+        # 透明动图每帧显示前清除上一帧，避免残影
+        params['disposal'] = 2
+    buffer = io.BytesIO()
+    frames[0].save(buffer, image_format, **params)
+    return buffer.getvalue()
+
+
+def render_animation(img, presets, outputs, indices, timer=None):
+    """逐帧缩放动图（GIF、APNG、动态 WebP），保留每帧的显示时长和循环次数
+
+    源图片逐帧解码，同一时间只保留当前帧，解码占用的内存与帧数无关；每帧通过 render_presets
+    生成所有预设的缩放结果。Pillow 的 GIF/APNG 编码器需要对比前后帧，WebP/AVIF 编码器一次接收所有帧，
+    因此缩放后的帧会保留到编码完成，这部分内存只与输出尺寸和帧数有关。
+    逐个产出 (预设序号, 编码后的字节, 错误信息)。
+    """
+    load_pillow()
+    timer = timer or StageTimer()
+    mode = 'RGBA' if img.has_transparency_data else 'RGB'
+    frames = {preset_idx: [] for preset_idx in indices}
+    errors = {}
+    durations = []
+    for frame in ImageSequence.Iterator(img):
+        with timer.stage('decode'):
+            frame_img = frame.convert(mode)
+        durations.append(frame.info.get('duration', 0))
+        pending = [preset_idx for preset_idx in indices if preset_idx not in errors]
+        for preset_idx, resized_img, error in render_presets(frame_img, presets, img.size, pending, timer):
+            if error is None:
+                frames[preset_idx].append(resized_img)
+            else:
+                errors[preset_idx] = error
+                frames[preset_idx] = []
+    loop = img.info.get('loop')
+
+    for preset_idx in indices:
+        error = errors.get(preset_idx)
+        data = None
+        if error is None:
+            try:
+                with timer.stage('encode', preset_idx):
+                    data = encode_animation(frames.pop(preset_idx), durations, loop,
+                                            outputs[preset_idx], presets[preset_idx])
+            except Exception as e:
+                error = str(e)
+        yield preset_idx, data, error
+
+
+# 单个 (文件, 预设) 的处理结果；error 为 None 表示成功
+# skipped 为 True 表示源图片和预设都未变化，沿用上次的输出；
+# input_bytes/output_bytes 为源文件和输出文件大小，timings 为 {阶段: 秒数}；
+# cached 为 True 表示输出直接取自输出缓存（见 OutputCache）
+CompressResult = namedtuple('CompressResult',
+                            ['source', 'preset_index', 'output', 'error', 'skipped',
+                             'input_bytes', 'output_bytes', 'timings', 'cached'],
+                            defaults=(False, 0, 0, None, False))
+
+# 一组任务共用的处理参数：预设列表、各预设的输出子文件夹和保留子文件夹结构的根文件夹
+TaskContext = namedtuple('TaskContext', ['presets', 'preset_folders', 'source_root'])
+# 处理阶段（按执行顺序），其中文件级阶段由同一源文件的所有预设共享
+STAGES = ('cache', 'open', 'decode', 'resize', 'handoff', 'encode', 'write')
+FILE_STAGES = ('cache', 'open', 'decode')
+
+
+def load_presets(presets_file=DEFAULT_PRESETS_FILE):
+    """读取保存的尺寸预设，返回 {名称: 预设}；文件不存在时返回空字典"""
+    if not os.path.exists(presets_file):
+        return {}
+    with open(presets_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_presets(presets, presets_file=DEFAULT_PRESETS_FILE):
+    """保存尺寸预设到文件"""
+    with open(presets_file, 'w', encoding='utf-8') as f:
+        json.dump(presets, f, ensure_ascii=False, indent=2)
+
+
+def list_image_files(folder):
+    """列出文件夹中的图片文件"""
+    return list(scan_images(folder))
+
+
+def _match_any(rel_path, patterns):
+    """判断相对路径是否匹配任一通配符；不含 / 的模式只匹配文件名"""
+    name = rel_path.rsplit('/', 1)[-1]
+    for pattern in patterns:
+        target = rel_path if '/' in pattern else name
+        if fnmatch.fnmatch(target.lower(), pattern.lower()):
+            return True
+    return False
+
+
+def scan_images(folder, recursive=False, include=None, exclude=None, skip_dirs=()):
+    """用 os.scandir 逐个产出文件夹中的图片文件路径
+
+    边扫描边产出，调用方可以在扫描完成前就开始处理。recursive 为 True 时扫描子文件夹
+    （跳过预设输出子文件夹和 skip_dirs 中的文件夹）。include/exclude 为通配符列表，
+    按相对于 folder 的路径（以 / 分隔）匹配；不含 / 的模式只匹配文件名。
+    """
+    skip_dirs = {os.path.normcase(os.path.abspath(d)) for d in skip_dirs}
+    stack = [(folder, '')]
+    while stack:
+        current, prefix = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    rel_path = prefix + entry.name
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        continue
+                    if is_dir:
+                        if (recursive and not fnmatch.fnmatch(entry.name, PRESET_FOLDER_PATTERN)
+                                and os.path.normcase(os.path.abspath(entry.path)) not in skip_dirs):
+                            stack.append((entry.path, rel_path + '/'))
+                        continue
+                    if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        continue
+                    if include and not _match_any(rel_path, include):
+                        continue
+                    if exclude and _match_any(rel_path, exclude):
+                        continue
+                    yield entry.path
+        except OSError:
+            # 子文件夹无法读取时跳过；根文件夹无法读取则报告错误
+            if current == folder:
+                raise
+
+
+def output_name_for(file_path, source_root=None, preset=None):
+    """计算输出文件相对于预设子文件夹的路径
+
+    给出 source_root 时保留源文件相对于它的子文件夹结构，否则只使用文件名。
+    给出 preset 且预设指定了与源文件不同的输出格式时，在文件名后追加该格式的扩展名（如 x.jpg.webp），
+    避免 x.jpg 和 x.png 写到同一个输出文件。
+    """
+    output_name = os.path.basename(file_path)
+    if source_root:
+        rel_path = os.path.relpath(os.path.abspath(file_path), os.path.abspath(source_root))
+        if not rel_path.startswith(os.pardir):
+            output_name = rel_path
+    image_format = preset_option(preset, 'format') if preset is not None else ''
+    if image_format:
+        extension = os.path.splitext(output_name)[1].lower()
+        if extension not in (('.jpg', '.jpeg') if image_format == 'JPEG' else (OUTPUT_FORMATS[image_format],)):
+            output_name += OUTPUT_FORMATS[image_format]
+    return output_name
+
+
+def prepare_output_folders(output_folder, presets):
+    """为每个预设创建输出子文件夹，返回子文件夹路径列表"""
+    preset_folders = []
+    for preset_idx, preset in enumerate(presets):
+        preset_folder = os.path.join(output_folder, preset_folder_name(preset_idx, preset))
+        os.makedirs(preset_folder, exist_ok=True)
+        preset_folders.append(preset_folder)
+    return preset_folders
+
+
+def write_bytes(output_file, data):
+    """把编码好的数据写入输出文件
+
+    先写入同一文件夹中的临时文件并同步到磁盘，再重命名为输出文件，进程中断时不会留下写了一半的输出。
+    """
+    output_folder = os.path.dirname(output_file)
+    os.makedirs(output_folder, exist_ok=True)
+    tmp_file = os.path.join(output_folder, f".{os.path.basename(output_file)}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+# 本进程的输出写入线程池及创建它的进程号（fork 出的子进程需要重新创建）
+_writer = None
+_writer_pid = None
+
+
+def _output_writer():
+    """本进程的输出写入线程池（见 process_file），第一次使用时创建"""
+    global _writer, _writer_pid
+    if _writer is None or _writer_pid != os.getpid():
+        _writer = ThreadPoolExecutor(max_workers=WRITE_BEHIND_THREADS, thread_name_prefix="image_writer")
+        _writer_pid = os.getpid()
+    return _writer
+
+
+def _read_source(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+def read_ahead(tasks, max_bytes=READ_AHEAD_BYTES, threads=READ_AHEAD_THREADS):
+    """按原顺序逐个产出 (任务, 源文件内容或None)，同时在后台线程中提前读入后续任务的源文件
+
+    tasks 的每一项以 (文件路径, 需要处理的预设序号或None, ...) 开头，会提前读取。已读入但尚未产出的
+    文件总大小不超过 max_bytes；单个文件超过 max_bytes、无需处理或读取失败时内容为 None，
+    由 process_file 自己读取（并报告错误）。max_bytes 为 0 或 None 时不预读。
+    """
+    if not max_bytes:
+        for task in tasks:
+            yield task, None
+        return
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="image_reader")
+    # (任务, future 或 None, 计入窗口的字节数)
+    queue = deque()
+    buffered = 0
+    tasks = iter(tasks)
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and (not queue or buffered < max_bytes):
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                file_path, only = task[0], task[1]
+                try:
+                    size = os.path.getsize(file_path)
+                except OSError:
+                    size = None
+                if size is None or size > max_bytes or (only is not None and not only):
+                    queue.append((task, None, 0))
+                else:
+                    queue.append((task, executor.submit(_read_source, file_path), size))
+                    buffered += size
+            if not queue:
+                return
+            task, future, size = queue.popleft()
+            buffered -= size
+            data = None
+            if future is not None:
+                try:
+                    data = future.result()
+                except OSError:
+                    pass
+            yield task, data
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def open_source(file_path, data=None):
+    """打开源图片；data 为已读入内存的文件内容时从内存中打开，错误信息中仍显示文件路径"""
+    load_pillow()
+    if data is None:
+        return Image.open(file_path)
+    try:
+        return Image.open(io.BytesIO(data))
+    except Image.UnidentifiedImageError:
+        raise Image.UnidentifiedImageError(f"cannot identify image file {file_path!r}") from None
+
+
+def _shared_memory(name=None, size=0):
+    """创建或打开共享内存块，不交给 resource_tracker 管理
+
+    共享内存在一个工作进程中创建，在另一个工作进程中读取，最后由主进程 unlink()；
+    交给 resource_tracker 管理时，创建或打开它的工作进程退出时会提前释放并报告泄漏。
+    """
+    try:
+        return shared_memory.SharedMemory(name, create=name is None, size=size, track=False)
+    except TypeError:
+        # Python 3.13 之前没有 track 参数
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name, create=name is None, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedImage:
+    """放在共享内存中、在进程之间传递的图片
+
+    生产端 create() 先用 tobytes() 取出像素、再复制进共享内存，共复制两次；pickle 时只传递共享内存名称、
+    模式和尺寸。RGB 图片按 Pillow 的内部布局以 RGBX 存放，读取端 open() 用 frombuffer() 直接映射为图片，不再复制；JPEG、WebP 和 AVIF 编码器可以直接读取 RGBX。
+    共享内存由主进程在所有读取都完成后 unlink() 释放。
+    """
+
+    def __init__(self, name, mode, size):
+        self.name = name
+        self.mode = mode
+        self.size = size
+
+    @classmethod
+    def create(cls, image):
+        """把图片像素复制到新建的共享内存中（tobytes() 和写入共享内存各复制一次）"""
+        mode = 'RGBX' if image.mode == 'RGB' else image.mode
+        data = image.tobytes('raw', mode)
+        shm = _shared_memory(size=max(len(data), 1))
+        try:
+            shm.buf[:len(data)] = data
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+        shm.close()
+        return cls(shm.name, mode, image.size)
+
+    @contextmanager
+    def open(self):
+        """映射共享内存中的图片（只读，不复制像素），离开 with 块后不能再使用"""
+        load_pillow()
+        shm = _shared_memory(self.name)
+        try:
+            image = Image.frombuffer(self.mode, self.size, shm.buf, 'raw', self.mode, 0, 1)
+            try:
+                yield image
+            finally:
+                image.close()
+                del image
+        finally:
+            shm.close()
+
+    def unlink(self):
+        """释放共享内存，已经释放时忽略"""
+        try:
+            # 不经过 _shared_memory 打开：unlink() 会从 resource_tracker 注销，与打开时的注册抵消
+            shm = shared_memory.SharedMemory(self.name)
+        except FileNotFoundError:
+            return
+        shm.close()
+        shm.unlink()
+
+
+def encode_shared(shared, file_path, preset_idx, output_file, preset, cache_file=None, hooks=None, cache=None):
+    """编码并写入另一个进程交来的预设输出（见 process_file 的 handoff 参数）
+
+    返回 (错误信息, 输出字节数, 各阶段耗时)。
+    """
+    timer = StageTimer(file_path, hooks)
+    try:
+        with shared.open() as image:
+            with timer.stage('encode', preset_idx):
+                data = encode_for_preset(image, output_file, preset)
+        with timer.stage('write', preset_idx):
+            write_bytes(output_file, data)
+            if cache is not None and cache_file is not None:
+                cache.store(output_file, cache_file)
+    except Exception as e:
+        return str(e), 0, timer.preset_timings.get(preset_idx, {})
+    return None, len(data), timer.preset_timings.get(preset_idx, {})
+
+
+def _process_file_task(file_path, presets, preset_folders, only, source_root, hooks, cache, handoff, data):
+    """工作进程中执行的 process_file，返回 (结果列表, 交给其他进程编码的输出)"""
+    shared = {} if handoff else None
+    results = process_file(file_path, presets, preset_folders, only, source_root, hooks, cache, shared, data)
+    return results, shared or {}
+
+
+def process_file(file_path, presets, preset_folders, only=None, source_root=None, hooks=None, cache=None,
+                 handoff=None, data=None):
+    """只解码一次源图片并生成队列中所有预设的输出
+
+    only 为需要生成的预设序号，其余预设记为跳过；为空时不会打开图片。
+    动图按 keeps_animation 判断逐帧处理（见 render_animation），其余预设只使用第一帧。
+    给出 source_root 时在输出文件夹中保留源文件的子文件夹结构。
+    hooks 为阶段耗时回调，见 StageTimer。cache 为 OutputCache 时先从缓存中取输出，
+    所有预设都命中时不会打开图片；新生成的输出会加入缓存。
+    handoff 为字典时，大图片（SPLIT_ENCODE_MIN_PIXELS 以上且需要生成两个以上预设）中编码较慢的输出
+    （见 slow_encode）不在本进程编码，而是放入共享内存，以 {预设序号: (SharedImage, 缓存文件路径或None)}
+    记在 handoff 中，由调用方交给 encode_shared 编码写入，这些预设结果的 output_bytes 和编码、写入耗时由调用方补上。
+    data 为已读入内存的源文件内容（见 read_ahead），给出时不再读取 file_path。
+    编码好的输出交给本进程的写入线程写入磁盘，写入的同时继续编码其余预设，所有写入完成后才返回。
+    返回按预设序号排列的 CompressResult 列表。
+    """
+    load_pillow()
+    outputs = [os.path.join(preset_folder, output_name_for(file_path, source_root, preset))
+               for preset_folder, preset in zip(preset_folders, presets)]
+    indices = list(range(len(presets))) if only is None else sorted(only)
+    timer = StageTimer(file_path, hooks)
+    errors = {}
+    output_bytes = {}
+    input_bytes = 0
+    cached = set()
+    cache_files = {}
+
+    # 预设序号 -> 写入任务
+    writes = {}
+
+    def write(preset_idx, encoded):
+        with timer.stage('write', preset_idx):
+            write_bytes(outputs[preset_idx], encoded)
+            if cache is not None:
+                cache.store(outputs[preset_idx], cache_files[preset_idx])
+        return len(encoded)
+
+    def save(preset_idx, encoded):
+        writes[preset_idx] = _output_writer().submit(write, preset_idx, encoded)
+
+    if indices:
+        try:
+            input_bytes = len(data) if data is not None else os.path.getsize(file_path)
+            if cache is not None:
+                with timer.stage('cache'):
+                    source_sha256 = (hashlib.sha256(data).hexdigest() if data is not None
+                                     else file_sha256(file_path))
+                    for preset_idx in indices:
+                        cache_files[preset_idx] = cache.path_for(source_sha256, presets[preset_idx],
+                                                                 outputs[preset_idx])
+                        if cache.fetch(cache_files[preset_idx], outputs[preset_idx]):
+                            cached.add(preset_idx)
+                            errors[preset_idx] = None
+                            output_bytes[preset_idx] = os.path.getsize(outputs[preset_idx])
+            pending = [preset_idx for preset_idx in indices if preset_idx not in cached]
+            if pending:
+                with timer.stage('open'):
+                    img = open_source(file_path, data)
+                with img:
+                    original_size = img.size
+                    animated = [i for i in pending if keeps_animation(img, outputs[i], presets[i])]
+                    still = [i for i in pending if i not in animated]
+                    if animated:
+                        for preset_idx, encoded, error in render_animation(img, presets, outputs, animated, timer):
+                            if error is None:
+                                try:
+                                    save(preset_idx, encoded)
+                                except Exception as e:
+                                    error = str(e)
+                            errors[preset_idx] = error
+                        if still:
+                            # 其余预设只使用第一帧
+                            img.seek(0)
+                    if still:
+                        with timer.stage('decode'):
+                            source_img = shrink_on_load(img, [presets[i] for i in still])
+                        split = (handoff is not None and len(still) >= 2
+                                 and original_size[0] * original_size[1] >= SPLIT_ENCODE_MIN_PIXELS)
+                        for preset_idx, resized_img, error in render_presets(source_img, presets, original_size,
+                                                                             still, timer):
+                            if (error is None and split and resized_img.mode in SHAREABLE_MODES
+                                    and slow_encode(outputs[preset_idx], presets[preset_idx])):
+                                try:
+                                    with timer.stage('handoff', preset_idx):
+                                        handoff[preset_idx] = (SharedImage.create(resized_img),
+                                                               cache_files.get(preset_idx))
+                                    errors[preset_idx] = None
+                                    continue
+                                except Exception:
+                                    # 共享内存不足等情况下在本进程编码
+                                    pass
+                            if error is None:
+                                try:
+                                    with timer.stage('encode', preset_idx):
+                                        encoded = encode_for_preset(resized_img, outputs[preset_idx],
+                                                                    presets[preset_idx])
+                                    save(preset_idx, encoded)
+                                except Exception as e:
+                                    error = str(e)
+                            errors[preset_idx] = error
+        except Exception as e:
+            # 打开或解码失败时，所有尚未处理的预设都记为失败
+            for preset_idx in indices:
+                errors.setdefault(preset_idx, str(e))
+    for preset_idx, future in writes.items():
+        try:
+            output_bytes[preset_idx] = future.result()
+        except Exception as e:
+            errors[preset_idx] = str(e)
+    return [CompressResult(file_path, preset_idx, outputs[preset_idx], errors.get(preset_idx),
+                           skipped=preset_idx not in errors,
+                           input_bytes=input_bytes if preset_idx in errors else 0,
+                           output_bytes=output_bytes.get(preset_idx, 0),
+                           timings=timer.timings_for(preset_idx) if preset_idx in errors else None,
+                           cached=preset_idx in cached)
+            for preset_idx in range(len(presets))]
+
+
+def failed_results(file_path, presets, preset_folders, error, source_root=None):
+    """整个文件处理失败时，为每个预设生成失败记录"""
+    return [CompressResult(file_path, preset_idx,
+                           os.path.join(preset_folder, output_name_for(file_path, source_root, preset)),
+                           str(error))
+            for preset_idx, (preset_folder, preset) in enumerate(zip(preset_folders, presets))]
+
+
+def preset_fingerprint(preset):
+    """计算预设参数的指纹，参数变化后需要重新处理
+
+    取默认值的可选参数不参与计算，新增参数不会让旧的处理记录失效。
+    """
+    normalized = {key: value for key, value in preset.items()
+                  if key not in PRESET_DEFAULTS or value != PRESET_DEFAULTS[key]}
+    data = json.dumps(normalized, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def file_sha256(file_path):
+    """计算文件内容的 SHA-256"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class OutputCache:
+    """按 (源文件内容哈希, 预设参数) 保存编码后输出的本地缓存，可在不同文件夹和多次处理之间共用
+
+    缓存文件名由源文件的 SHA-256、预设指纹（见 preset_fingerprint）和输出扩展名计算得出。
+    命中时把缓存文件硬链接（不支持时复制）为输出，完全不需要解码；未命中时处理完成后把输出加入缓存。
+    每次命中都会更新缓存文件的修改时间，trim() 按修改时间淘汰最久未使用的缓存，使总大小不超过 max_bytes。
+    对象只保存路径和容量，可以传给工作进程。
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    def path_for(self, source_sha256, preset, output_file):
+        """计算缓存文件路径"""
+        key = hashlib.sha256(f"{CACHE_VERSION}:{source_sha256}:{preset_fingerprint(preset)}".encode('utf-8'))
+        digest = key.hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + os.path.splitext(output_file)[1].lower())
+
+    def fetch(self, cache_file, output_file):
+        """缓存命中时生成输出文件并返回 True"""
+        try:
+            link_output(cache_file, output_file)
+        except OSError:
+            return False
+        try:
+            os.utime(cache_file)
+        except OSError:
+            pass
+        return True
+
+    def store(self, output_file, cache_file):
+        """把刚生成的输出加入缓存（写入失败不影响处理）"""
+        try:
+            link_output(output_file, cache_file)
+        except OSError:
+            pass
+
+    def trim(self):
+        """缓存超过容量上限时按最近使用时间淘汰，返回删除的文件数"""
+        entries = []
+        total = 0
+        now = time.time()
+        try:
+            folders = [entry.path for entry in os.scandir(self.cache_dir) if entry.is_dir()]
+        except OSError:
+            return 0
+        for folder in folders:
+            try:
+                with os.scandir(folder) as files:
+                    for entry in files:
+                        stat = entry.stat()
+                        if entry.name.startswith('.'):
+                            # 中断时残留的临时文件
+                            if now - stat.st_mtime > 3600:
+                                try:
+                                    os.remove(entry.path)
+                                except OSError:
+                                    pass
+                            continue
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                        total += stat.st_size
+            except OSError:
+                continue
+        entries.sort()
+        removed = 0
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+def _node_file_name(file_name, node):
+    """在文件名的扩展名前加上节点名，如 .image_compressor_manifest.host-1.json"""
+    prefix, ext = os.path.splitext(file_name)
+    safe_node = ''.join(ch if ch.isalnum() or ch in '-_' else '_' for ch in node)
+    return f"{prefix}.{safe_node}{ext}"
+
+
+@contextmanager
+def _file_lock(lock_path, stale_after=MANIFEST_LOCK_STALE):
+    """以 O_EXCL 创建锁文件实现的互斥锁，在共享文件系统上可跨机器使用
+
+    持有者崩溃留下的锁文件超过 stale_after 秒后被打破。
+    """
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_after:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                # 锁刚被释放
+                continue
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+
+class OutputManifest:
+    """单个预设输出子文件夹的处理记录
+
+    以输出文件名为键，记录源文件路径、大小、修改时间（可选内容哈希）、预设指纹和记录时间。
+    每条新记录会立即追加到日志文件中；处理中断（崩溃、断电）后再次加载时回放日志，
+    已完成的任务不会重复处理。save() 写入处理记录后删除日志。
+    多个节点共同处理同一个文件夹时（见 distributed.py），每个节点给出 node，使用自己的日志文件；
+    加载时合并处理记录和所有节点的日志，同一输出以记录时间最新的为准。save() 在锁内重新读取其他节点
+    已保存的记录，合并后写回共用的处理记录，并删除已合并的节点文件，节点文件不会随运行次数累积。
+    """
+
+    def __init__(self, preset_folder, node=None):
+        self.node = node
+        self.path = os.path.join(preset_folder, MANIFEST_NAME)
+        self.journal_path = os.path.join(preset_folder, _node_file_name(JOURNAL_NAME, node) if node else JOURNAL_NAME)
+        self.preset_folder = preset_folder
+        self.entries = {}
+        self.dirty = False
+        self._journal = None
+        self._last_sync = 0.0
+        # prune() 删除的输出，合并其他节点的记录时不再加回
+        self._removed = set()
+        self._load()
+
+    def _load(self):
+        """合并处理记录（包括旧版本留下的节点记录）和所有日志，返回读取过的节点文件路径"""
+        node_files = []
+        for manifest_path in self._related_files(MANIFEST_NAME):
+            try:
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    self._merge(json.load(f).get('entries', {}).items())
+            except (OSError, ValueError):
+                # 记录不存在或已损坏时视为全部需要重新处理
+                continue
+            if manifest_path != self.path:
+                node_files.append(manifest_path)
+        for journal_path in self._related_files(JOURNAL_NAME):
+            if self._replay_journal(journal_path) and journal_path != self.journal_path:
+                node_files.append(journal_path)
+        return node_files
+
+    def _related_files(self, base_name):
+        """本文件夹中的处理记录（或日志）文件：不带节点名的文件在前，各节点的文件在后"""
+        paths = [os.path.join(self.preset_folder, base_name)]
+        prefix, ext = os.path.splitext(base_name)
+        try:
+            names = sorted(name for name in os.listdir(self.preset_folder)
+                           if name.startswith(prefix + '.') and name.endswith(ext) and name != base_name)
+        except OSError:
+            names = []
+        paths.extend(os.path.join(self.preset_folder, name) for name in names)
+        return paths
+
+    def _merge(self, items):
+        """合并记录，同一输出保留记录时间最新的一条"""
+        for output_name, entry in items:
+            current = self.entries.get(output_name)
+            if current is None or entry.get('recorded', 0) >= current.get('recorded', 0):
+                self.entries[output_name] = entry
+
+    def _replay_journal(self, journal_path):
+        """回放上次中断的处理留下的日志，日志存在时返回 True"""
+        try:
+            with open(journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # 最后一行可能只写了一半
+                        break
+                    self._merge([(entry.pop('output'), entry)])
+                    self.dirty = True
+        except OSError:
+            return False
+        return True
+
+    def _append_journal(self, output_name, entry):
+        """追加一条完成记录到日志"""
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+        self._journal.write(json.dumps(dict(entry, output=output_name), ensure_ascii=False) + '\n')
+        self._journal.flush()
+        now = time.monotonic()
+        if now - self._last_sync >= JOURNAL_SYNC_INTERVAL:
+            os.fsync(self._journal.fileno())
+            self._last_sync = now
+
+    def is_current(self, output_name, source, stat, fingerprint, use_hash=False):
+        """判断输出是否仍与源文件和预设一致"""
+        entry = self.entries.get(output_name)
+        if (entry is None or entry['source'] != source or entry['size'] != stat.st_size
+                or entry['fingerprint'] != fingerprint
+                or not os.path.exists(os.path.join(self.preset_folder, output_name))):
+            return False
+        if entry['mtime_ns'] == stat.st_mtime_ns:
+            return True
+        if use_hash and entry.get('sha256'):
+            # 只是修改时间变化（如重新复制）而内容相同，更新记录后沿用输出
+            if entry['sha256'] == file_sha256(source):
+                entry['mtime_ns'] = stat.st_mtime_ns
+                self.dirty = True
+                return True
+        return False
+
+    def record(self, output_name, source, stat, fingerprint, sha256=None):
+        """记录一次成功的输出"""
+        entry = {
+            'source': source,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'fingerprint': fingerprint,
+            'recorded': time.time(),
+        }
+        if sha256:
+            entry['sha256'] = sha256
+        self.entries[output_name] = entry
+        self.dirty = True
+        self._append_journal(output_name, entry)
+
+    def prune(self, tmp_max_age=0):
+        """删除源文件已不存在的输出和中断时残留的临时文件，返回删除的输出路径
+
+        tmp_max_age 大于 0 时只删除超过这么多秒未修改的临时文件（其他节点可能正在写入）。
+        """
+        removed = []
+        now = time.time()
+        for root, _, files in os.walk(self.preset_folder):
+            for name in files:
+                if name.startswith('.') and name.endswith('.tmp'):
+                    tmp_path = os.path.join(root, name)
+                    try:
+                        if tmp_max_age <= 0 or now - os.path.getmtime(tmp_path) >= tmp_max_age:
+                            os.remove(tmp_path)
+                    except OSError:
+                        pass
+        for output_name, entry in list(self.entries.items()):
+            if os.path.exists(entry['source']):
+                continue
+            output_file = os.path.join(self.preset_folder, output_name)
+            try:
+                os.remove(output_file)
+                removed.append(output_file)
+            except FileNotFoundError:
+                pass
+            del self.entries[output_name]
+            self._removed.add(output_name)
+            self.dirty = True
+        return removed
+
+    def save(self, stale_age=0):
+        """写入处理记录（先写临时文件再替换，避免写到一半），然后删除日志
+
+        给出 node 时在锁内合并其他节点已保存的记录后写入共用的处理记录，删除已合并的旧版节点记录，
+        以及超过 stale_age 秒未修改的其他节点日志（崩溃的节点留下的；仍在运行的节点的日志保留，
+        它结束时自己合并）。stale_age 为 0 时删除已合并的所有节点日志。
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if not self.node:
+            if self.dirty:
+                self._write()
+        else:
+            with _file_lock(self.path + '.lock'):
+                own = self.entries
+                self.entries = {}
+                node_files = self._load()
+                for output_name in self._removed:
+                    self.entries.pop(output_name, None)
+                self._merge(own.items())
+                self._write()
+                now = time.time()
+                for node_file in node_files:
+                    try:
+                        if (node_file.endswith('.json') or stale_age <= 0
+                                or now - os.path.getmtime(node_file) >= stale_age):
+                            os.remove(node_file)
+                    except OSError:
+                        pass
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+
+    def _write(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'entries': self.entries}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+
+class IncrementalPlanner:
+    """增量处理：根据各预设文件夹的处理记录，只处理新增或变化的源文件
+
+    skip_unchanged 为 False 时重新处理所有源文件，但仍会更新处理记录和日志，
+    处理中断后以增量方式再次处理即可从中断处继续。node 见 OutputManifest。
+    """
+
+    def __init__(self, presets, preset_folders, use_hash=False, source_root=None, skip_unchanged=True,
+                 node=None):
+        self.use_hash = use_hash
+        self.skip_unchanged = skip_unchanged
+        self.source_root = source_root
+        self.presets = presets
+        self.fingerprints = [preset_fingerprint(preset) for preset in presets]
+        self.manifests = [OutputManifest(preset_folder, node) for preset_folder in preset_folders]
+        self._stats = {}
+
+    def plan(self, paths):
+        """逐个产出 (文件路径, 需要处理的预设序号)"""
+        for file_path in paths:
+            source = os.path.abspath(file_path)
+            try:
+                stat = os.stat(source)
+            except OSError:
+                # 交给处理流程报告错误
+                yield file_path, None
+                continue
+            only = [preset_idx for preset_idx, manifest in enumerate(self.manifests)
+                    if not self.skip_unchanged
+                    or not manifest.is_current(output_name_for(file_path, self.source_root,
+                                                               self.presets[preset_idx]),
+                                               source, stat, self.fingerprints[preset_idx], self.use_hash)]
+            if only:
+                # [stat, 内容哈希]，哈希在记录时按需计算一次
+                self._stats[file_path] = [stat, None]
+            yield file_path, only
+
+    def record(self, result):
+        """记录成功处理的结果"""
+        if result.error is not None or result.skipped:
+            return
+        state = self._stats.get(result.source)
+        if state is None:
+            return
+        source = os.path.abspath(result.source)
+        if self.use_hash and state[1] is None:
+            state[1] = file_sha256(source)
+        self.manifests[result.preset_index].record(
+            output_name_for(result.source, self.source_root, self.presets[result.preset_index]), source, state[0],
+            self.fingerprints[result.preset_index], state[1])
+
+    def finish(self, prune=True, tmp_max_age=0):
+        """保存处理记录；prune 为 True 时删除源文件已不存在的输出，返回删除的输出路径
+
+        tmp_max_age 见 OutputManifest.prune 和 OutputManifest.save 的 stale_age。
+        """
+        removed = []
+        for manifest in self.manifests:
+            if prune:
+                removed.extend(manifest.prune(tmp_max_age))
+            manifest.save(tmp_max_age)
+        self._stats.clear()
+        return removed
+
+
+def perceptual_hash(file_path):
+    """计算源图片的感知哈希（dHash），返回 (宽, 高, 哈希整数)
+
+    只解码一张很小的灰度缩略图（JPEG 通过 draft() 直接按缩小后的尺寸解码），比较相邻像素的明暗。
+    以不同文件名、不同压缩参数保存的同一张照片哈希相同或只相差几位。动图返回 None，不参与去重。
+    """
+    load_pillow()
+    with Image.open(file_path) as img:
+        if getattr(img, 'is_animated', False):
+            return None
+        size = img.size
+        img.draft('L', (DEDUP_HASH_SIZE * 8, DEDUP_HASH_SIZE * 8))
+        # 不使用 reducing_gap：分步缩小时格子的边界随源图尺寸变化，JPEG（draft 后）和其他格式的哈希会相差很多
+        proxy = img.convert('L').resize((DEDUP_HASH_SIZE + 1, DEDUP_HASH_SIZE), Image.Resampling.BOX)
+    if _load_numpy() is not None:
+        pixels = np.asarray(proxy, dtype=np.int16)
+        digest = int.from_bytes(np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes(), 'big')
+    else:
+        pixels = list(proxy.getdata())
+        row = DEDUP_HASH_SIZE + 1
+        bits = ''.join('1' if pixels[y * row + x + 1] > pixels[y * row + x] else '0'
+                       for y in range(DEDUP_HASH_SIZE) for x in range(DEDUP_HASH_SIZE))
+        digest = int(bits, 2)
+    return size[0], size[1], digest
+
+
+def dedup_proxy(file_path):
+    """解码用于确认重复图片的 DEDUP_PROXY_SIZE 见方 RGBA 缩略图，返回像素字节"""
+    load_pillow()
+    with Image.open(file_path) as img:
+        # draft() 缩小得太多时 JPEG 的边缘与其他格式差别较大，这里只缩小到缩略图的 8 倍
+        img.draft('RGB', (DEDUP_PROXY_SIZE * 8, DEDUP_PROXY_SIZE * 8))
+        proxy = img.convert('RGBA').resize((DEDUP_PROXY_SIZE, DEDUP_PROXY_SIZE), Image.Resampling.BOX)
+    return proxy.tobytes()
+
+
+def proxies_match(first, second):
+    """两张缩略图（见 dedup_proxy）的每个像素各通道都相差不超过 DEDUP_MAX_PIXEL_DIFF 时返回 True"""
+    if _load_numpy() is not None:
+        difference = np.abs(np.frombuffer(first, dtype=np.uint8).astype(np.int16)
+                            - np.frombuffer(second, dtype=np.uint8))
+        return int(difference.max()) <= DEDUP_MAX_PIXEL_DIFF
+    return all(abs(a - b) <= DEDUP_MAX_PIXEL_DIFF for a, b in zip(first, second))
+
+
+def link_output(source_file, output_file):
+    """为重复图片创建输出：优先硬链接到已生成的输出，不支持时复制"""
+    output_folder = os.path.dirname(output_file)
+    os.makedirs(output_folder, exist_ok=True)
+    tmp_file = os.path.join(output_folder, f".{os.path.basename(output_file)}.{os.getpid()}.tmp")
+    try:
+        try:
+            os.link(source_file, tmp_file)
+        except OSError:
+            shutil.copyfile(source_file, tmp_file)
+        os.replace(tmp_file, output_file)
+    except BaseException:
+        try:
+            os.remove(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+class DuplicateFinder:
+    """去重：内容相同的源图片只处理一张（代表图片），其余副本硬链接或复制代表图片的输出
+
+    plan() 在线程池中计算感知哈希（解码缩略图时会释放 GIL），保持任务顺序逐个产出需要处理的任务，
+    重复图片暂存起来；resolve() 在代表图片处理完成后为这些副本生成输出，产出它们的 CompressResult。
+    感知哈希只用于找出候选：构图相同、颜色或小块文字不同的图片（如不同颜色的商品图）哈希也很接近，
+    因此还要比较候选与代表图片的彩色缩略图（见 dedup_proxy），每个像素都几乎相同才视为重复。
+    这样以不同文件名或不同压缩参数保存的同一张照片也能去重；只有候选才需要解码缩略图。
+    查找相似哈希时把哈希分为 DEDUP_MAX_DISTANCE + 1 段建立索引：相差不超过 DEDUP_MAX_DISTANCE 位的
+    两个哈希至少有一段完全相同，只需逐位比较这一段相同的候选。
+    """
+
+    def __init__(self, presets, preset_folders, source_root=None, threads=None):
+        self.presets = presets
+        self.preset_folders = preset_folders
+        self.source_root = source_root
+        self.threads = threads or os.cpu_count() or 1
+        # (分组, 段序号, 段的值) -> [(哈希, 代表图片路径)]
+        self._index = {}
+        self._segment_bits = math.ceil(DEDUP_HASH_SIZE * DEDUP_HASH_SIZE / (DEDUP_MAX_DISTANCE + 1))
+        # 代表图片路径 -> 等待生成输出的 [(副本路径, 预设序号)]
+        self._waiting = {}
+        # 已处理完成的代表图片路径 -> 各预设的 CompressResult
+        self._done = {}
+        # 代表图片处理完成后才出现的副本，下次 resolve() 时产出
+        self._ready = []
+        # 已解码的缩略图：文件路径 -> 像素字节（解码失败时为 None）
+        self._proxies = {}
+
+    def _hashed(self, jobs):
+        """按任务顺序产出 (任务, 哈希)，同时最多计算 threads * 4 个哈希"""
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            for job in jobs:
+                file_path, only = job
+                # 无需处理的任务不计算哈希
+                future = executor.submit(perceptual_hash, file_path) if only is None or only else None
+                window.append((job, future))
+                if len(window) >= self.threads * 4:
+                    yield self._pop(window)
+            while window:
+                yield self._pop(window)
+
+    @staticmethod
+    def _pop(window):
+        job, future = window.popleft()
+        try:
+            key = future.result() if future is not None else None
+        except Exception:
+            # 交给处理流程报告错误
+            key = None
+        return job, key
+
+    def _segments(self, group, digest):
+        """把哈希分段，产出索引键"""
+        mask = (1 << self._segment_bits) - 1
+        for segment in range(DEDUP_MAX_DISTANCE + 1):
+            yield group, segment, (digest >> (segment * self._segment_bits)) & mask
+
+    def _proxy(self, file_path):
+        if file_path not in self._proxies:
+            try:
+                self._proxies[file_path] = dedup_proxy(file_path)
+            except Exception:
+                self._proxies[file_path] = None
+        return self._proxies[file_path]
+
+    def find(self, group, digest, file_path):
+        """在同一分组中查找哈希相似且缩略图几乎相同的代表图片，找不到时返回 None"""
+        checked = set()
+        for index_key in self._segments(group, digest):
+            for candidate, representative in self._index.get(index_key, ()):
+                if representative in checked or bin(candidate ^ digest).count('1') > DEDUP_MAX_DISTANCE:
+                    continue
+                checked.add(representative)
+                proxy = self._proxy(file_path)
+                if proxy is None:
+                    return None
+                representative_proxy = self._proxy(representative)
+                if representative_proxy is not None and proxies_match(proxy, representative_proxy):
+                    return representative
+        return None
+
+    def add(self, group, digest, file_path):
+        """把图片登记为代表图片"""
+        for index_key in self._segments(group, digest):
+            self._index.setdefault(index_key, []).append((digest, file_path))
+
+    def plan(self, jobs):
+        """逐个产出需要实际处理的 (文件路径, 预设序号)，重复图片不会产出"""
+        for (file_path, only), key in self._hashed(jobs):
+            representative = None
+            if key is not None:
+                width, height, digest = key
+                # 尺寸和各预设的输出格式都相同的图片才能共用输出
+                group = (width, height, tuple(
+                    os.path.splitext(output_name_for(file_path, preset=preset))[1].lower()
+                    for preset in self.presets))
+                representative = self.find(group, digest, file_path)
+            if representative is None:
+                if key is not None:
+                    self.add(group, digest, file_path)
+                    self._waiting[file_path] = []
+                yield file_path, only
+                continue
+            indices = range(len(self.presets)) if only is None else only
+            duplicates = [(file_path, preset_idx, representative) for preset_idx in indices]
+            if representative in self._done:
+                self._ready.extend(duplicates)
+            else:
+                self._waiting[representative].extend(duplicates)
+
+    def resolve(self, file_path=None, results=None):
+        """记录代表图片的处理结果，为等待中的副本生成输出，逐个产出副本的 CompressResult"""
+        if file_path in self._waiting:
+            self._done[file_path] = results
+            self._ready.extend(self._waiting.pop(file_path))
+        ready, self._ready = self._ready, []
+        for duplicate, preset_idx, representative in ready:
+            yield self._link(duplicate, preset_idx, self._done[representative][preset_idx])
+
+    def _link(self, duplicate, preset_idx, source_result):
+        """按代表图片的处理结果为单个副本生成输出"""
+        output = os.path.join(self.preset_folders[preset_idx],
+                              output_name_for(duplicate, self.source_root, self.presets[preset_idx]))
+        if source_result.error is not None:
+            return CompressResult(duplicate, preset_idx, output,
+                                  f"与 {os.path.basename(source_result.source)} 内容相同，"
+                                  f"该图片处理失败: {source_result.error}")
+        try:
+            input_bytes = os.path.getsize(duplicate)
+            start = time.perf_counter()
+            link_output(source_result.output, output)
+            elapsed = time.perf_counter() - start
+            output_bytes = os.path.getsize(output)
+        except Exception as e:
+            return CompressResult(duplicate, preset_idx, output, str(e))
+        return CompressResult(duplicate, preset_idx, output, None, input_bytes=input_bytes,
+                              output_bytes=output_bytes, timings={'write': elapsed})
+
+
+class ProcessingPool:
+    """可复用的多进程处理池
+
+    把 (文件, 预设队列) 任务分发到进程池，进程池在多次处理之间保持运行（预热）。
+    取消时停止派发新任务，撤回尚未开始的任务，并等待已在执行的任务完成。
+    设置 memory_budget（字节）后，派发前只读取文件头估算每个任务需要的内存，
+    同时执行的任务总估算不超过预算；超过预算的大图单独执行。预算用完时暂停读取后续任务（反压）。
+    read_ahead 为预读窗口（字节），后续任务的源文件在后台线程中提前读入内存随任务发给工作进程（见 read_ahead），
+    磁盘或网络存储的读取与工作进程的计算同时进行；为 0 时由工作进程自己读取。
+    工作进程异常退出（如内存不足被杀死）时在本次处理中重建进程池，受牵连的任务逐个单独重新执行，
+    只有单独执行时仍然导致崩溃的任务记为失败。
+    """
+
+    def __init__(self, max_workers=None, memory_budget=None, read_ahead=READ_AHEAD_BYTES):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.memory_budget = memory_budget
+        self.read_ahead = read_ahead
+        self._executor = None
+
+    def set_worker_count(self, max_workers):
+        """设置工作进程数，下次处理时生效"""
+        if max_workers != self.max_workers:
+            self.max_workers = max_workers
+            self.shutdown()
+
+    def shutdown(self):
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def run(self, jobs, presets, preset_folders, cancel_event=None, source_root=None, hooks=None, cache=None):
+        """处理一批图片，每处理完一个文件产出 (文件路径, [CompressResult])
+
+        jobs 为 (文件路径, 需要处理的预设序号或None) 的可迭代对象，会按需逐个读取。
+        """
+        context = TaskContext(presets, preset_folders, source_root)
+        tasks = ((file_path, only, context) for file_path, only in jobs)
+        for file_path, _, results in self.run_tasks(tasks, cancel_event, hooks, cache):
+            yield file_path, results
+
+    def run_tasks(self, tasks, cancel_event=None, hooks=None, cache=None):
+        """处理来自多组预设和输出文件夹的任务，每处理完一个文件产出 (文件路径, TaskContext, [CompressResult])
+
+        tasks 为 (文件路径, 需要处理的预设序号或None, TaskContext) 的可迭代对象，会按需逐个读取。
+        不同 TaskContext 的任务共用同一个派发窗口和内存预算。
+        有空闲进程时，大图片解码缩放后各预设的编码通过共享内存分给多个进程同时执行（见 SharedImage），
+        所有预设都写入后才产出该文件的结果。
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        executor = self._executor
+        budget = self.memory_budget
+
+        # future -> ('file', 文件路径, 预设序号, TaskContext, 估算内存) 或 ('encode', 分发状态, 预设序号)
+        pending = {}
+        # 等待各预设编码完成的文件：{'file_path', 'context', 'cost', 'results', 'shared', 'remaining'}
+        splits = []
+        in_flight_bytes = 0
+        # 因内存预算暂缓派发的任务 (文件路径, 预设序号, TaskContext, 源文件内容, 估算内存)
+        held = None
+        # 工作进程异常退出（如内存不足被杀死）时进程池中的任务都会失败，重建进程池后这些任务逐个单独重新执行，
+        # 单独执行时仍然崩溃的任务才记为失败，其余任务不受影响
+        suspects = deque()
+        tasks = read_ahead(tasks, self.read_ahead)
+        # 每个进程最多排队两个任务，保证取消时需要等待的任务较少
+        window = self.max_workers * 2
+
+        def rebuild():
+            nonlocal executor
+            executor.shutdown(wait=False)
+            executor = self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        def send(entry, data):
+            if entry[0] == 'file':
+                _, file_path, only, context, _ = entry
+                # 只有存在空闲进程时才拆分编码，所有进程都忙时拆分只会增加复制
+                handoff = self.max_workers > 1 and len(pending) < self.max_workers
+                return executor.submit(_process_file_task, file_path, context.presets, context.preset_folders,
+                                       only, context.source_root, hooks, cache, handoff, data)
+            _, split, preset_idx = entry
+            image, cache_file = split['shared'][preset_idx]
+            return executor.submit(encode_shared, image, split['file_path'], preset_idx,
+                                   split['results'][preset_idx].output, split['context'].presets[preset_idx],
+                                   cache_file, hooks, cache)
+
+        def submit(entry, data=None):
+            # 派发失败的任务记为已经失败的 future，与执行失败的任务一同处理
+            try:
+                try:
+                    future = send(entry, data)
+                except BrokenProcessPool:
+                    # 进程池已经崩溃，重建后再派发
+                    rebuild()
+                    future = send(entry, data)
+            except Exception as e:
+                future = Future()
+                future.set_exception(e)
+            pending[future] = entry
+
+        try:
+            while True:
+                cancelled = cancel_event is not None and cancel_event.is_set()
+                if suspects:
+                    if cancelled:
+                        # 取消时不再重新执行文件任务，已解码图片的编码任务继续完成
+                        suspects = deque(entry for entry in suspects if entry[0] == 'encode')
+                    if suspects and not pending:
+                        # 重新执行的任务逐个单独派发，进程池再次崩溃时就能确定是哪个任务导致的
+                        entry = suspects.popleft()
+                        if entry[0] == 'file':
+                            in_flight_bytes += entry[4]
+                        submit(entry)
+                while not suspects and not cancelled and len(pending) < window:
+                    if held is None:
+                        task = next(tasks, None)
+                        if task is None:
+                            break
+                        (file_path, only, context), data = task
+                        if only is not None and not only:
+                            # 所有预设都无需处理，不必派发到进程池
+                            yield file_path, context, process_file(file_path, context.presets,
+                                                                   context.preset_folders, only, context.source_root)
+                            continue
+                        cost = estimate_job_memory(file_path, context.presets, only, data) if budget else 0
+                        held = (file_path, only, context, data, cost)
+
+                    file_path, only, context, data, cost = held
+                    if budget and pending and in_flight_bytes + cost > budget:
+                        # 等待已派发的任务完成后再派发；超过预算的大图会等到没有其他任务时单独执行
+                        break
+                    held = None
+                    submit(('file', file_path, only, context, cost), data)
+                    in_flight_bytes += cost
+
+                if cancelled:
+                    # 撤回尚未开始的任务，只等待正在执行的任务（已解码图片的编码任务继续完成）
+                    held = None
+                    for future in [f for f, entry in pending.items() if entry[0] == 'file' and f.cancel()]:
+                        in_flight_bytes -= pending.pop(future)[4]
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                if any(_pool_broken(future) for future in done):
+                    # 工作进程异常退出后进程池中其余的任务也会失败：等它们全部结束后统一处理，并重建进程池。
+                    # 只有一个任务在执行时就是它导致的，记为失败；否则把失败的任务留待逐个单独重新执行
+                    wait(pending)
+                    done = list(pending)
+                    rebuild()
+                    if len(done) > 1:
+                        for future in done:
+                            if _pool_broken(future):
+                                entry = pending.pop(future)
+                                if entry[0] == 'file':
+                                    in_flight_bytes -= entry[4]
+                                suspects.append(entry)
+                        done = list(pending)
+                for future in done:
+                    entry = pending.pop(future)
+                    if entry[0] == 'encode':
+                        _, split, preset_idx = entry
+                        try:
+                            encoded = future.result()
+                        except Exception as e:
+                            encoded = (_task_error(e), 0, {})
+                        split['results'][preset_idx] = _merge_encoded(split['results'][preset_idx], *encoded)
+                        split['remaining'] -= 1
+                    else:
+                        _, file_path, _, context, cost = entry
+                        try:
+                            results, shared = future.result()
+                        except Exception as e:
+                            results = failed_results(file_path, context.presets, context.preset_folders,
+                                                     _task_error(e), context.source_root)
+                            shared = {}
+                        split = {'file_path': file_path, 'context': context, 'cost': cost, 'results': results,
+                                 'shared': shared, 'remaining': 0}
+                        splits.append(split)
+                        for preset_idx in shared:
+                            submit(('encode', split, preset_idx))
+                            split['remaining'] += 1
+                    if split['remaining'] == 0:
+                        splits.remove(split)
+                        in_flight_bytes -= split['cost']
+                        for image, _ in split['shared'].values():
+                            image.unlink()
+                        yield split['file_path'], split['context'], split['results']
+        finally:
+            tasks.close()
+            # 提前结束（取消后关闭生成器或出错）时释放尚未编码完的共享内存
+            for split in splits:
+                for image, _ in split['shared'].values():
+                    image.unlink()
+
+
+def _pool_broken(future):
+    """任务是否因为工作进程异常退出、进程池不可再用而失败"""
+    return isinstance(future.exception(), BrokenProcessPool)
+
+
+def _task_error(error):
+    """进程池任务失败时记录的错误信息"""
+    if isinstance(error, BrokenProcessPool):
+        return "处理时工作进程异常退出（可能是内存不足）"
+    return str(error)
+
+
+def _merge_encoded(result, error, output_bytes, timings):
+    """把其他进程编码写入的结果合并到解码进程返回的 CompressResult 中"""
+    return result._replace(error=error, output_bytes=output_bytes, timings={**(result.timings or {}), **timings})
+
+
+def compress(paths, presets, output_folder, workers=1, cancel_event=None,
+             incremental=False, use_hash=False, pool=None, source_root=None, hooks=None,
+             memory_budget=None, dedup=False, cache=None, read_ahead=READ_AHEAD_BYTES):
+    """批量处理图片，逐个产出 CompressResult
+
+    paths 可以是任意可迭代对象（包括生成器），presets 为预设字典列表，
+    输出写入 output_folder 下每个预设对应的 preset_N_wW_hH 子文件夹。
+    workers 大于 1 时使用多进程处理，结果按完成顺序产出；也可以传入已有的 ProcessingPool 复用进程。
+    每个预设输出文件夹都保存处理记录，完成的任务会立即写入日志，处理中断后可以续传；
+    完整处理后删除源文件已不存在的输出。incremental 为 True 时跳过源文件和预设都未变化
+    （包括中断前已完成）的输出；use_hash 为 True 时修改时间变化但内容相同的源文件也会跳过。
+    给出 source_root 时（如配合 scan_images 递归扫描）在输出中保留源文件的子文件夹结构。
+    hooks 为各处理阶段结束时调用的回调（见 StageTimer），每个结果的 timings 中也记录了各阶段耗时，
+    可交给 RunReport 汇总。
+    memory_budget 为多进程处理时同时处理的图片估算内存上限（字节），见 ProcessingPool。
+    dedup 为 True 时内容相同的源图片只处理一张，其余副本硬链接或复制它的输出，见 DuplicateFinder。
+    cache 为 OutputCache 时命中缓存的输出不需要解码，处理结束后按容量上限淘汰缓存。
+    read_ahead 为预读窗口（字节），后续源文件在后台线程中提前读入内存，读取与计算同时进行（见 read_ahead）；
+    传入 pool 时使用 pool 的设置。
+    """
+    presets = [dict(preset) for preset in presets]
+    preset_folders = prepare_output_folders(output_folder, presets)
+    planner = IncrementalPlanner(presets, preset_folders, use_hash, source_root, skip_unchanged=incremental)
+    finder = None
+    if dedup:
+        finder = DuplicateFinder(presets, preset_folders, source_root, pool.max_workers if pool else workers)
+
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = ProcessingPool(workers, memory_budget, read_ahead)
+
+    completed = False
+    try:
+        yield from _process_planned(paths, planner, finder, presets, preset_folders, pool, cancel_event,
+                                    source_root, hooks, cache, read_ahead)
+        completed = cancel_event is None or not cancel_event.is_set()
+    finally:
+        if own_pool:
+            pool.shutdown()
+        # 只有完整处理后才清理输出，避免取消时误删
+        planner.finish(prune=completed)
+        if cache is not None:
+            cache.trim()
+
+
+def _process_planned(paths, planner, finder, presets, preset_folders, pool, cancel_event, source_root, hooks,
+                     cache, read_ahead):
+    """按 planner（及去重的 finder）规划并处理一批图片，记录并逐个产出 CompressResult（compress 和 watch 共用）"""
+    jobs = planner.plan(paths)
+    if finder is not None:
+        jobs = finder.plan(jobs)
+    if pool is None:
+        batches = _run_inline(jobs, presets, preset_folders, cancel_event, source_root, hooks, cache, read_ahead)
+    else:
+        batches = pool.run(jobs, presets, preset_folders, cancel_event, source_root, hooks, cache)
+    for file_path, results in batches:
+        if finder is not None:
+            results = results + list(finder.resolve(file_path, results))
+        for result in results:
+            planner.record(result)
+            yield result
+    if finder is not None:
+        # 代表图片在此之前已处理完成的副本
+        for result in finder.resolve():
+            planner.record(result)
+            yield result
+
+
+def _run_inline(jobs, presets, preset_folders, cancel_event, source_root=None, hooks=None, cache=None,
+                read_ahead_bytes=READ_AHEAD_BYTES):
+    """在当前进程中逐个处理，后续源文件在后台线程中预读"""
+    context = TaskContext(presets, preset_folders, source_root)
+    tasks = ((file_path, only, context) for file_path, only in jobs)
+    for file_path, _, results in _run_tasks_inline(tasks, cancel_event, hooks, cache, read_ahead_bytes):
+        yield file_path, results
+
+
+def _run_tasks_inline(tasks, cancel_event, hooks=None, cache=None, read_ahead_bytes=READ_AHEAD_BYTES):
+    """在当前进程中逐个处理带 TaskContext 的任务（见 ProcessingPool.run_tasks），后续源文件在后台线程中预读"""
+    tasks = read_ahead(tasks, read_ahead_bytes)
+    try:
+        for (file_path, only, context), data in tasks:
+            if cancel_event is not None and cancel_event.is_set():
+                break
+            yield file_path, context, process_file(file_path, context.presets, context.preset_folders, only,
+                                                   context.source_root, hooks, cache, data=data)
+    finally:
+        tasks.close()
+
+
+class FolderWatcher:
+    """轮询文件夹，找出新增或修改后已写入完成的图片
+
+    每次 poll() 用 scan_images 扫描一遍文件夹，记录每个文件的大小和修改时间。
+    文件在 settle 秒内没有变化（或修改时间已早于 settle 秒前）才视为写入完成并返回，
+    正在上传或复制的文件会等到写完后再处理。同一文件只返回一次，之后再次修改时重新返回。
+    include_existing 为 False 时第一次扫描到的文件视为已处理。
+    """
+
+    def __init__(self, folder, recursive=False, include=None, exclude=None, skip_dirs=(),
+                 settle=WATCH_SETTLE, include_existing=True):
+        self.folder = folder
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.skip_dirs = skip_dirs
+        self.settle = settle
+        self.include_existing = include_existing
+        # 文件路径 -> 已返回时的 (大小, 修改时间)
+        self._reported = {}
+        # 文件路径 -> ((大小, 修改时间), 首次看到该状态的时刻)
+        self._pending = {}
+        self._first_poll = True
+
+    def poll(self):
+        """扫描一遍文件夹，返回已写入完成且尚未返回过的图片路径列表"""
+        now = time.monotonic()
+        wall_now = time.time()
+        ready = []
+        seen = set()
+        for file_path in scan_images(self.folder, self.recursive, self.include, self.exclude, self.skip_dirs):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # 扫描后被删除或重命名
+                continue
+            seen.add(file_path)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            if self._reported.get(file_path) == signature:
+                continue
+            if self._first_poll and not self.include_existing:
+                self._reported[file_path] = signature
+                continue
+            pending = self._pending.get(file_path)
+            if pending is None or pending[0] != signature:
+                pending = self._pending[file_path] = (signature, now)
+            if now - pending[1] >= self.settle or wall_now - stat.st_mtime >= self.settle:
+                del self._pending[file_path]
+                self._reported[file_path] = signature
+                ready.append(file_path)
+        # 忘记已删除的文件，重新出现时再处理
+        for state in (self._reported, self._pending):
+            for file_path in [path for path in state if path not in seen]:
+                del state[file_path]
+        self._first_poll = False
+        return ready
+
+
+def watch(folder, presets, output_folder, cancel_event, interval=WATCH_INTERVAL, settle=WATCH_SETTLE,
+          recursive=False, include=None, exclude=None, include_existing=True, workers=1, pool=None,
+          incremental=True, on_idle=None, use_hash=False, hooks=None, memory_budget=None, dedup=False,
+          cache=None, read_ahead=READ_AHEAD_BYTES, save_interval=WATCH_SAVE_INTERVAL):
+    """监视文件夹，持续处理新增的图片，逐个产出 CompressResult，直到 cancel_event 被设置
+
+    每 interval 秒用 FolderWatcher 扫描一次，处理已写入完成的新图片；进程池、处理记录和去重索引
+    在整个监视期间保持，每批新图片不必重新加载处理记录。完成的任务随时写入日志，
+    每 save_interval 秒（有新的处理结果时）以及停止时保存处理记录，并删除源文件已不存在的输出。
+    recursive 为 True 时在输出中保留子文件夹结构，输出文件夹在源文件夹内时不会被扫描。
+    on_idle 在每次扫描后没有新图片时调用。其余参数与 compress() 相同。
+    """
+    watcher = FolderWatcher(folder, recursive, include, exclude, skip_dirs=[output_folder],
+                            settle=settle, include_existing=include_existing)
+    presets = [dict(preset) for preset in presets]
+    preset_folders = prepare_output_folders(output_folder, presets)
+    source_root = folder if recursive else None
+    planner = IncrementalPlanner(presets, preset_folders, use_hash, source_root, skip_unchanged=incremental)
+    finder = None
+    if dedup:
+        finder = DuplicateFinder(presets, preset_folders, source_root, pool.max_workers if pool else workers)
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = ProcessingPool(workers, memory_budget, read_ahead)
+    last_save = time.monotonic()
+    unsaved = False
+    try:
+        while not cancel_event.is_set():
+            ready = watcher.poll()
+            if ready:
+                for result in _process_planned(ready, planner, finder, presets, preset_folders, pool,
+                                               cancel_event, source_root, hooks, cache, read_ahead):
+                    unsaved = True
+                    yield result
+            elif on_idle is not None:
+                on_idle()
+            if unsaved and time.monotonic() - last_save >= save_interval:
+                planner.finish()
+                if cache is not None:
+                    cache.trim()
+                last_save = time.monotonic()
+                unsaved = False
+            cancel_event.wait(interval)
+    finally:
+        if own_pool:
+            pool.shutdown()
+        planner.finish()
+        if cache is not None:
+            cache.trim()
+
+
+# 任务文件中的一个任务：源文件夹、输出文件夹、预设列表，以及扫描选项（见 scan_images）
+BatchJob = namedtuple('BatchJob', ['source', 'output', 'presets', 'recursive', 'include', 'exclude'],
+                      defaults=(False, None, None))
+
+
+def _resolve_job_preset(entry, named_presets):
+    """把任务文件中的预设（名称或预设字典）转换为预设字典"""
+    if isinstance(entry, str):
+        if entry not in named_presets:
+            raise ValueError(f"找不到预设: {entry}")
+        entry = named_presets[entry]
+    if not isinstance(entry, dict):
+        raise ValueError(f"预设应为名称或对象: {entry!r}")
+    missing = [key for key in PRESET_REQUIRED_KEYS if key not in entry]
+    if missing:
+        raise ValueError(f"预设缺少参数 {', '.join(missing)}: {entry!r}")
+    return dict(entry)
+
+
+def load_job_spec(spec_file, named_presets=None):
+    """读取任务文件（JSON），返回 BatchJob 列表
+
+    任务文件列出多组源文件夹和输出文件夹，每组有自己的预设队列::
+
+        {
+          "version": 1,
+          "presets": {"缩略图": {"width": 200, "height": 200, "quality": 75, "crop": true}},
+          "defaults": {"recursive": true, "exclude": ["*.tmp.*"]},
+          "jobs": [
+            {"source": "catalog/shoes", "output": "export/shoes", "presets": ["缩略图", "详情页"]},
+            {"source": "catalog/bags", "presets": [{"width": 800, "height": 600, "quality": 80, "crop": false}]}
+          ]
+        }
+
+    预设可以写名称或与保存的预设相同格式的对象。名称先在任务文件的 presets 中查找，
+    再在 named_presets（如 load_presets() 的结果）中查找。defaults 中的 recursive、include、exclude
+    和 presets 作为各任务的默认值。output 省略时输出到源文件夹。相对路径相对于任务文件所在文件夹。
+    任务文件格式错误、预设不存在、源文件夹不存在或两个任务写入同一个预设输出子文件夹时抛出 ValueError。
+    """
+    with open(spec_file, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if not isinstance(spec, dict) or not isinstance(spec.get('jobs'), list):
+        raise ValueError("任务文件中缺少 jobs 列表")
+    version = spec.get('version', JOB_SPEC_VERSION)
+    if not isinstance(version, int) or isinstance(version, bool):
+        raise ValueError(f"任务文件版本应为整数: {version!r}")
+    if version > JOB_SPEC_VERSION:
+        raise ValueError(f"不支持的任务文件版本: {version}")
+    for key in ('presets', 'defaults'):
+        if not isinstance(spec.get(key, {}), dict):
+            raise ValueError(f"{key} 应为对象: {spec[key]!r}")
+    presets = dict(named_presets or {})
+    presets.update(spec.get('presets', {}))
+    defaults = spec.get('defaults', {})
+    base_dir = os.path.dirname(os.path.abspath(spec_file))
+
+    jobs = []
+    # 预设输出子文件夹 -> 使用它的任务序号
+    owners = {}
+    for job_idx, entry in enumerate(spec['jobs']):
+        try:
+            if not isinstance(entry, dict) or 'source' not in entry:
+                raise ValueError("缺少 source")
+            options = dict(defaults, **entry)
+            _check_job_options(options)
+            source = os.path.join(base_dir, os.path.expanduser(options['source']))
+            if not os.path.isdir(source):
+                raise ValueError(f"源文件夹不存在: {source}")
+            output = os.path.join(base_dir, os.path.expanduser(options.get('output') or options['source']))
+            job_presets = [_resolve_job_preset(preset, presets) for preset in options.get('presets') or []]
+            if not job_presets:
+                raise ValueError("没有指定预设")
+            for preset_idx, preset in enumerate(job_presets):
+                # 同一个预设子文件夹的处理记录只能由一个任务维护
+                folder = os.path.normcase(os.path.join(os.path.abspath(output),
+                                                       preset_folder_name(preset_idx, preset)))
+                if folder in owners:
+                    raise ValueError(f"与任务 {owners[folder] + 1} 写入同一个输出文件夹: {folder}")
+                owners[folder] = job_idx
+            jobs.append(BatchJob(os.path.normpath(source), os.path.normpath(output), job_presets,
+                                 bool(options.get('recursive', False)), options.get('include'),
+                                 options.get('exclude')))
+        except ValueError as e:
+            raise ValueError(f"任务 {job_idx + 1}: {e}") from None
+    return jobs
+
+
+def _check_job_options(options):
+    """检查任务（已合并 defaults）中各参数的类型"""
+    for key in ('source', 'output'):
+        if options.get(key) is not None and not isinstance(options[key], str):
+            raise ValueError(f"{key} 应为路径字符串: {options[key]!r}")
+    if options.get('presets') is not None and not isinstance(options['presets'], list):
+        raise ValueError(f"presets 应为列表: {options['presets']!r}")
+    for key in ('include', 'exclude'):
+        patterns = options.get(key)
+        if patterns is not None and not (isinstance(patterns, list)
+                                         and all(isinstance(pattern, str) for pattern in patterns)):
+            raise ValueError(f"{key} 应为通配符字符串列表: {patterns!r}")
+
+
+def _with_context(jobs, context):
+    """把 (文件路径, 预设序号) 任务转换为带 TaskContext 的任务"""
+    for file_path, only in jobs:
+        yield file_path, only, context
+
+
+def _interleave(iterables):
+    """轮流从各个可迭代对象中取出一项，直到全部取完"""
+    active = deque(iter(iterable) for iterable in iterables)
+    while active:
+        iterator = active.popleft()
+        for item in iterator:
+            yield item
+            active.append(iterator)
+            break
+
+
+def compress_jobs(jobs, workers=1, cancel_event=None, incremental=False, use_hash=False, pool=None,
+                  hooks=None, memory_budget=None, dedup=False, cache=None, read_ahead=READ_AHEAD_BYTES):
+    """用同一个进程池处理多个 BatchJob，逐个产出 (任务序号, CompressResult)
+
+    每个任务与 compress() 一样边扫描边处理，有各自的预设、输出文件夹和处理记录；
+    各任务的图片轮流派发到共用的进程池中，小文件夹不必排在大文件夹后面，
+    某个文件夹只剩最后几张图片时其他文件夹的图片也会补上空闲的进程。
+    所有任务结束后保存各自的处理记录，未被取消时删除源文件已不存在的输出。其余参数与 compress() 相同。
+    """
+    planners = []
+    finders = []
+    streams = []
+    # id(TaskContext) -> 任务序号
+    job_of = {}
+    for job_idx, job in enumerate(jobs):
+        presets = [dict(preset) for preset in job.presets]
+        preset_folders = prepare_output_folders(job.output, presets)
+        source_root = job.source if job.recursive else None
+        planner = IncrementalPlanner(presets, preset_folders, use_hash, source_root, skip_unchanged=incremental)
+        planned = planner.plan(scan_images(job.source, job.recursive, job.include, job.exclude,
+                                           skip_dirs=[job.output]))
+        finder = None
+        if dedup:
+            finder = DuplicateFinder(presets, preset_folders, source_root, pool.max_workers if pool else workers)
+            planned = finder.plan(planned)
+        context = TaskContext(presets, preset_folders, source_root)
+        job_of[id(context)] = job_idx
+        planners.append(planner)
+        finders.append(finder)
+        streams.append(_with_context(planned, context))
+
+    tasks = _interleave(streams)
+    own_pool = pool is None and workers > 1
+    if own_pool:
+        pool = ProcessingPool(workers, memory_budget, read_ahead)
+    if pool is None:
+        batches = _run_tasks_inline(tasks, cancel_event, hooks, cache, read_ahead)
+    else:
+        batches = pool.run_tasks(tasks, cancel_event, hooks, cache)
+
+    completed = False
+    try:
+        for file_path, context, results in batches:
+            job_idx = job_of[id(context)]
+            if finders[job_idx] is not None:
+                results = results + list(finders[job_idx].resolve(file_path, results))
+            for result in results:
+                planners[job_idx].record(result)
+                yield job_idx, result
+        for job_idx, finder in enumerate(finders):
+            if finder is not None:
+                for result in finder.resolve():
+                    planners[job_idx].record(result)
+                    yield job_idx, result
+        completed = cancel_event is None or not cancel_event.is_set()
+    finally:
+        if own_pool:
+            pool.shutdown()
+        for planner in planners:
+            planner.finish(prune=completed)
+        if cache is not None:
+            cache.trim()
+
+
+def percentile(sorted_values, pct):
+    """按最近秩法计算已排序数据的百分位数"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class RunReport:
+    """汇总一次处理的统计信息：吞吐量、各阶段耗时、压缩率和延迟百分位数
+
+    逐个传入 compress() 产出的 CompressResult，处理结束后可导出为 JSON 或 CSV。
+    """
+
+    def __init__(self, presets):
+        self.presets = [dict(preset) for preset in presets]
+        self.started = time.perf_counter()
+        self.finished = None
+        self.results = []
+        self.success_count = 0
+        self.skipped_count = 0
+        self.cached_count = 0
+        self.error_count = 0
+        self._file_latency = {}
+        # 已处理源文件的总大小，同一源文件只计一次
+        self._input_bytes = 0
+        self._counted_sources = set()
+
+    def add(self, result):
+        """记录一个处理结果"""
+        self.results.append(result)
+        if result.skipped:
+            self.skipped_count += 1
+        elif result.error is None:
+            self.success_count += 1
+            if result.cached:
+                self.cached_count += 1
+        else:
+            self.error_count += 1
+        if result.input_bytes and result.source not in self._counted_sources:
+            self._counted_sources.add(result.source)
+            self._input_bytes += result.input_bytes
+        if result.timings:
+            # 文件级阶段由各预设共享，只计一次
+            latency = self._file_latency.setdefault(
+                result.source, sum(result.timings.get(stage, 0.0) for stage in FILE_STAGES))
+            self._file_latency[result.source] = latency + sum(
+                seconds for stage, seconds in result.timings.items() if stage not in FILE_STAGES)
+
+    def finish(self):
+        """标记处理结束"""
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def done_count(self):
+        return len(self.results)
+
+    def images_per_second(self):
+        """每秒处理的源图片数（按 (文件, 预设) 数量折算）"""
+        elapsed = self.elapsed
+        if not elapsed or not self.presets:
+            return 0.0
+        return self.done_count / len(self.presets) / elapsed
+
+    def megabytes_per_second(self):
+        """每秒读取的源文件数据量 (MB)"""
+        elapsed = self.elapsed
+        if not elapsed:
+            return 0.0
+        return self._input_bytes / elapsed / 1e6
+
+    def eta(self, total):
+        """按当前速度估算剩余秒数；total 为 (文件, 预设) 总数，未知时返回 None"""
+        if not total or not self.done_count:
+            return None
+        rate = self.done_count / self.elapsed
+        return max(0.0, (total - self.done_count) / rate)
+
+    def summary(self):
+        """生成汇总统计"""
+        stages = {}
+        for stage in STAGES:
+            if stage in FILE_STAGES:
+                per_file = {result.source: result.timings[stage] for result in self.results
+                            if result.timings and stage in result.timings}
+                values = sorted(seconds * 1000 for seconds in per_file.values())
+            else:
+                values = sorted(result.timings[stage] * 1000 for result in self.results
+                                if result.timings and stage in result.timings)
+            if values:
+                stages[stage] = self._distribution(values)
+                stages[stage]['total_ms'] = round(sum(values), 3)
+
+        presets = []
+        for preset_idx, preset in enumerate(self.presets):
+            processed = [result for result in self.results
+                         if result.preset_index == preset_idx and result.error is None and not result.skipped]
+            input_bytes = sum(result.input_bytes for result in processed)
+            output_bytes = sum(result.output_bytes for result in processed)
+            latency = sorted(sum(result.timings.values()) * 1000 for result in processed if result.timings)
+            presets.append({
+                'preset_index': preset_idx + 1,
+                'preset': preset,
+                'processed': len(processed),
+                'input_bytes': input_bytes,
+                'output_bytes': output_bytes,
+                'compression_ratio': round(output_bytes / input_bytes, 4) if input_bytes else None,
+                'latency_ms': self._distribution(latency) if latency else None,
+            })
+
+        file_latency = sorted(seconds * 1000 for seconds in self._file_latency.values())
+        return {
+            'elapsed_seconds': round(self.elapsed, 3),
+            'success': self.success_count,
+            'skipped': self.skipped_count,
+            'cached': self.cached_count,
+            'failed': self.error_count,
+            'files': len(self._file_latency),
+            'images_per_second': round(self.images_per_second(), 3),
+            'input_mb_per_second': round(self.megabytes_per_second(), 3),
+            'file_latency_ms': self._distribution(file_latency) if file_latency else None,
+            'stages_ms': stages,
+            'presets': presets,
+        }
+
+    @staticmethod
+    def _distribution(sorted_values):
+        return {
+            'count': len(sorted_values),
+            'p50': round(percentile(sorted_values, 50), 3),
+            'p90': round(percentile(sorted_values, 90), 3),
+            'p99': round(percentile(sorted_values, 99), 3),
+            'max': round(sorted_values[-1], 3),
+        }
+
+    def rows(self):
+        """逐个 (文件, 预设) 的明细行"""
+        for result in self.results:
+            timings = result.timings or {}
+            row = {
+                'source': result.source,
+                'preset_index': result.preset_index + 1,
+                'output': result.output,
+                'status': ('skipped' if result.skipped else 'cached' if result.cached
+                           else 'ok' if result.error is None else 'failed'),
+                'error': result.error or '',
+                'input_bytes': result.input_bytes,
+                'output_bytes': result.output_bytes,
+                'compression_ratio': (round(result.output_bytes / result.input_bytes, 4)
+                                      if result.input_bytes and result.output_bytes else ''),
+            }
+            for stage in STAGES:
+                row[f'{stage}_ms'] = round(timings[stage] * 1000, 3) if stage in timings else ''
+            yield row
+
+    def write_json(self, path):
+        """导出 JSON 报告（汇总和明细）"""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'summary': self.summary(), 'results': list(self.rows())}, f,
+                      ensure_ascii=False, indent=2)
+
+    def write_csv(self, path):
+        """导出 CSV 明细"""
+        rows = list(self.rows())
+        fieldnames = ['source', 'preset_index', 'output', 'status', 'error', 'input_bytes',
+                      'output_bytes', 'compression_ratio'] + [f'{stage}_ms' for stage in STAGES]
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def write(self, path):
+        """按扩展名导出 JSON 或 CSV 报告"""
+        if path.lower().endswith('.csv'):
+            self.write_csv(path)
+        else:
+            self.write_json(path)